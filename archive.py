@@ -0,0 +1,143 @@
+# Binary game archive. Every move is stored in 16 bits (its Move.code:
+# start square, end square and promotion piece), so a game of 80 plies
+# takes 164 bytes, and the reader memory-maps the file and only touches
+# the games asked for.
+#
+# Layout, all little-endian:
+#   file header   magic b'TCA1'
+#   games         result (1 byte), padding (1), ply count (2), move codes (2 each)
+#   padding       up to a multiple of 8
+#   index         start offset of every game (8 bytes each)
+#   trailer       index offset (8), game count (8), magic b'TCAX'
+#
+# Games start from the usual starting position.
+
+import mmap
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+from game import Game
+
+MAGIC = b'TCA1'
+TRAILER_MAGIC = b'TCAX'
+game_header = struct.Struct('<BxH')
+index_entry = struct.Struct('<Q')
+trailer = struct.Struct('<QQ4s')
+
+results = ['*', '1-0', '0-1', '1/2-1/2']
+
+# moves is a sequence of Move.code values
+ArchivedGame = namedtuple('ArchivedGame', ['result', 'moves'])
+
+class ArchiveWriter:
+
+	def __init__(self, path):
+		self.file = open(path, 'wb')
+		self.file.write(MAGIC)
+		self.offset = len(MAGIC)
+		self.offsets = array('Q')
+		# game -> codes of the moves played so far, see record
+		self.recording = {}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def __len__(self):
+		return len(self.offsets)
+
+	# write one game given as Move.code values and a result string
+	def add(self, codes, result='*'):
+		codes = array('H', codes)
+		if len(codes) > 0xffff:
+			raise ValueError("A game can have at most 65535 plies")
+		if sys.byteorder == 'big':
+			codes.byteswap()
+		self.offsets.append(self.offset)
+		self.file.write(game_header.pack(results.index(result), len(codes)))
+		self.file.write(codes.tobytes())
+		self.offset += game_header.size + 2 * len(codes)
+
+	# Start recording game as it is played: finish_move hands every move to
+	# the writer, and finish writes the game out.
+	def record(self, game):
+		codes = self.recording[game] = array('H')
+		game.recorder = lambda move: codes.append(move.code)
+
+	def finish(self, game):
+		game.recorder = None
+		self.add(self.recording.pop(game), game.result or '*')
+
+	# stop recording game without writing it
+	def discard(self, game):
+		game.recorder = None
+		del self.recording[game]
+
+	# write the index; games still being recorded are left out
+	def close(self):
+		if self.file.closed:
+			return
+		self.file.write(bytes(-self.offset % 8))
+		index_offset = self.offset + -self.offset % 8
+		offsets = array('Q', self.offsets)
+		if sys.byteorder == 'big':
+			offsets.byteswap()
+		self.file.write(offsets.tobytes())
+		self.file.write(trailer.pack(index_offset, len(self.offsets), TRAILER_MAGIC))
+		self.file.close()
+
+class ArchiveReader:
+
+	def __init__(self, path):
+		with open(path, 'rb') as f:
+			self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		if len(self.map) < len(MAGIC) + trailer.size or self.map[:len(MAGIC)] != MAGIC:
+			raise ValueError("{} is not a game archive".format(path))
+		index_offset, self.count, magic = trailer.unpack_from(self.map, len(self.map) - trailer.size)
+		if magic != TRAILER_MAGIC:
+			raise ValueError("{} is not a complete game archive".format(path))
+		self.index_offset = index_offset
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def __len__(self):
+		return self.count
+
+	def __getitem__(self, game_id):
+		if not 0 <= game_id < self.count:
+			raise IndexError("no game {} in the archive".format(game_id))
+		offset, = index_entry.unpack_from(self.map, self.index_offset + 8 * game_id)
+		result, plies = game_header.unpack_from(self.map, offset)
+		start = offset + game_header.size
+		# a copy of just this game, so no view into the map outlives it
+		moves = array('H')
+		moves.frombytes(self.map[start:start + 2 * plies])
+		if sys.byteorder == 'big':
+			moves.byteswap()
+		return ArchivedGame(results[result], moves)
+
+	def __iter__(self):
+		for game_id in range(self.count):
+			yield self[game_id]
+
+	def close(self):
+		self.map.close()
+
+# Play an archived game's moves on a new Game, yielding (None, game)
+# first and then (move, game) after every move; it is the same Game
+# object each time.
+def replay(moves):
+	game = Game()
+	yield None, game
+	for code in moves:
+		move = game.move_from_code(code)
+		game.push(move)
+		yield move, game
@@ -0,0 +1,170 @@
+# Micro-benchmarks for the Game hot paths (python -m benchmarks, or
+# python game.py bench): make_move for each piece type, is_check,
+# has_move, is_over, finish_move and print_board over a fixed set of
+# positions. Each benchmark is timed over several repeats and reported as
+# operations per second with a 95% confidence interval. Results can be
+# saved as a JSON baseline and later runs compared against it; the run
+# fails if any benchmark is clearly slower than its baseline by more than
+# the threshold.
+
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+
+from game import Game, perft_positions, piece_letters
+
+# the perft reference positions plus two endgames
+corpus = [fen for fen, counts in perft_positions.values()] + [
+	"8/8/4k3/3p4/3P4/4K3/8/8 w - - 0 40",
+	"6k1/5ppp/8/8/8/8/1r3PPP/3R2K1 b - - 3 30",
+]
+
+# two-sided 95% t values by degrees of freedom, for small repeat counts
+t_values = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+	2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086]
+
+def t_value(df):
+	return t_values[df - 1] if df <= len(t_values) else 1.96
+
+# name -> list of zero-argument calls, one operation each
+def build_benchmarks():
+	games = [Game.from_fen(fen) for fen in corpus]
+	benchmarks = {}
+	for letter in piece_letters[1:]:
+		cases = []
+		for game in games:
+			# the same move every run: the first of this piece's moves in notation order
+			move_strs = sorted(str(move) for move in game.legal_moves() if str(move)[0] == letter)
+			if move_strs:
+				cases.append(make_move_case(game, move_strs[0]))
+		benchmarks['make_move[{}]'.format(letter)] = cases
+	benchmarks['is_check'] = [game.is_check for game in games]
+	benchmarks['has_move'] = [game.has_move for game in games]
+	benchmarks['is_over'] = [is_over_case(game) for game in games]
+	benchmarks['finish_move'] = [finish_move_case(game, min(game.legal_moves(), key=str)) for game in games]
+	benchmarks['print_board'] = [game.print_board for game in games]
+	return benchmarks
+
+def make_move_case(game, move_str):
+	def case():
+		game.make_move(move_str)
+		game.pending_move = None
+	return case
+
+# the status is cleared first, since is_over is otherwise answered from
+# the cache after the first call
+def is_over_case(game):
+	def case():
+		game.cached_status = None
+		game.is_over()
+	return case
+
+# includes the pop that takes the move back
+def finish_move_case(game, move):
+	def case():
+		game.pending_move = move
+		game.finish_move()
+		game.pop()
+	return case
+
+def time_rounds(cases, rounds):
+	start = time.perf_counter()
+	for _ in range(rounds):
+		for case in cases:
+			case()
+	return time.perf_counter() - start
+
+# ops/sec of each repeat, each repeat running enough rounds over the
+# cases to take at least min_time seconds
+def measure(cases, repeats, min_time):
+	rounds = 1
+	while time_rounds(cases, rounds) < min_time:
+		rounds *= 2
+	ops = rounds * len(cases)
+	return [ops / time_rounds(cases, rounds) for _ in range(repeats)]
+
+def summarize(samples):
+	mean = statistics.mean(samples)
+	ci95 = t_value(len(samples) - 1) * statistics.stdev(samples) / math.sqrt(len(samples)) if len(samples) > 1 else 0.0
+	return {'ops_per_sec': round(mean, 1), 'ci95': round(ci95, 1), 'repeats': len(samples)}
+
+# Run the benchmarks whose names contain name_filter. Returns
+# {name: summary}; print_board output goes to os.devnull.
+def run_benchmarks(repeats=10, min_time=0.05, name_filter='', report=None):
+	results = {}
+	with open(os.devnull, 'w') as sink:
+		for name, cases in build_benchmarks().items():
+			if name_filter not in name or not cases:
+				continue
+			with redirect_stdout(sink):
+				samples = measure(cases, repeats, min_time)
+			results[name] = summarize(samples)
+			if report:
+				report(name, results[name])
+	return results
+
+# A benchmark has regressed when it is more than threshold (a fraction)
+# slower than the baseline and the two confidence intervals do not
+# overlap, so one noisy run is not reported as a slowdown.
+def regressed(result, base, threshold):
+	return (result['ops_per_sec'] < base['ops_per_sec'] * (1 - threshold)
+		and result['ops_per_sec'] + result['ci95'] < base['ops_per_sec'] - base['ci95'])
+
+def regressions(results, baseline, threshold):
+	return [name for name, result in results.items() if name in baseline and regressed(result, baseline[name], threshold)]
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='benchmarks', description="Benchmark the Game hot paths.")
+	parser.add_argument('--repeats', type=int, default=10, help="timed repeats per benchmark (default 10)")
+	parser.add_argument('--min-time', type=float, default=0.05, help="minimum seconds per repeat (default 0.05)")
+	parser.add_argument('--filter', default='', help="only run benchmarks whose name contains this")
+	parser.add_argument('--save', metavar='FILE', help="write the results to FILE as a JSON baseline")
+	parser.add_argument('--compare', metavar='FILE', help="compare against the JSON baseline in FILE")
+	parser.add_argument('--threshold', type=float, default=0.10,
+		help="fail when a benchmark is this fraction slower than the baseline (default 0.10)")
+	parser.add_argument('--json', action='store_true', help="print the results as JSON")
+	args = parser.parse_args(argv)
+	if args.repeats < 2:
+		parser.error("--repeats must be at least 2 for a confidence interval")
+	baseline = {}
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)['benchmarks']
+	def report(name, result):
+		if args.json:
+			return
+		line = "{:<14} {:>12.1f} ops/s  +-{:>5.1f}%".format(name, result['ops_per_sec'],
+			100 * result['ci95'] / result['ops_per_sec'])
+		if name in baseline:
+			change = result['ops_per_sec'] / baseline[name]['ops_per_sec'] - 1
+			line += "  {:>+7.1%} vs baseline{}".format(change, '  REGRESSION' if regressed(result, baseline[name], args.threshold) else '')
+		print(line)
+		sys.stdout.flush()
+	results = run_benchmarks(args.repeats, args.min_time, args.filter, report)
+	document = {
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'repeats': args.repeats,
+		'min_time': args.min_time,
+		'benchmarks': results
+	}
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump(document, f, indent=2)
+	slower = regressions(results, baseline, args.threshold)
+	if args.json:
+		document['regressions'] = slower
+		print(json.dumps(document, indent=2))
+	elif args.compare:
+		print("{} of {} benchmarks regressed by more than {:.0%}".format(len(slower), len(results), args.threshold))
+	return 1 if slower else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,83 @@
+# Opening book built from a game archive: for every position in the
+# first plies of the archived games, the moves played from it, how often,
+# and how they scored for the side that played them.
+#
+# The book file is the magic b'TCB1' followed by 28-byte records sorted
+# by position key and move: key (8 bytes), move code (2), padding (2),
+# games, wins, draws and losses (4 each), all big-endian. Like the
+# position index it is a sorted record file (see record_file), built with
+# an external sort and probed by binary search over a memory map.
+
+import struct
+from collections import namedtuple
+
+from archive import ArchiveReader, replay
+from game import WHITE
+from record_file import SortedRecordFile, SortedRecordWriter
+
+MAGIC = b'TCB1'
+record = struct.Struct('>QHxxIIII')
+
+# positions (key, move) counted in memory before a run is written out
+RUN_ENTRIES = 1 << 20
+
+# results for the side that played the move; games includes unfinished
+# ones, which count as none of wins, draws and losses
+BookMove = namedtuple('BookMove', ['code', 'games', 'wins', 'draws', 'losses'])
+
+def score(book_move):
+	decided = book_move.wins + book_move.draws + book_move.losses
+	return (book_move.wins + book_move.draws / 2) / decided if decided else None
+
+def packed(counts):
+	return [record.pack(key, code, *totals) for (key, code), totals in sorted(counts.items())]
+
+# the same position and move can turn up in several runs: add them up
+def combined(records):
+	current, totals = None, None
+	for data in records:
+		key, code, *counted = record.unpack(data)
+		if (key, code) != current:
+			if current is not None:
+				yield record.pack(*current, *totals)
+			current, totals = (key, code), [0, 0, 0, 0]
+		for i, n in enumerate(counted):
+			totals[i] += n
+	if current is not None:
+		yield record.pack(*current, *totals)
+
+# Build a book from the first max_ply plies of every game in archive_path.
+# Returns the number of (position, move) records written.
+def build_book(archive_path, book_path, max_ply=30, run_entries=RUN_ENTRIES):
+	counts = {}
+	with SortedRecordWriter(book_path, MAGIC, record) as writer:
+		with ArchiveReader(archive_path) as reader:
+			for archived in reader:
+				white_score = {'1-0': 1, '0-1': 0, '1/2-1/2': 0.5}.get(archived.result)
+				plays = replay(archived.moves[:max_ply])
+				move, game = next(plays)
+				key, color = game.key, game.color
+				for move, game in plays:
+					totals = counts.setdefault((key, move.code), [0, 0, 0, 0])
+					totals[0] += 1
+					if white_score is not None:
+						mover_score = white_score if color == WHITE else 1 - white_score
+						totals[{1: 1, 0.5: 2, 0: 3}[mover_score]] += 1
+					key, color = game.key, game.color
+				if len(counts) >= run_entries:
+					writer.add_run(packed(counts))
+					counts = {}
+		return writer.write(combined(writer.merged(packed(counts))))
+
+class OpeningBook(SortedRecordFile):
+
+	description = 'an opening book'
+
+	def __init__(self, path):
+		super().__init__(path, MAGIC, record)
+
+	# the book moves for the position with this key, most played first
+	def lookup(self, key):
+		moves = [BookMove(*fields) for fields in self.find(key)]
+		moves.sort(key=lambda book_move: book_move.games, reverse=True)
+		return moves
@@ -0,0 +1,309 @@
+# Alpha-beta search for the computer player: negamax with iterative
+# deepening, a quiescence search over captures, and MVV-LVA, killer and
+# history move ordering. Game.best_move is the usual way in; analyze runs
+# several searches in parallel processes.
+
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+from game import Game, WHITE, EMPTY, PAWN, QUEEN, TYPE_MASK, EN_PASSANT
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+MATE = 100000
+MAX_PLY = 64
+INFINITY = MATE + 1
+
+piece_values = [0, 100, 320, 330, 500, 900, 0]
+
+class SearchStopped(Exception):
+	pass
+
+# Game.evaluate from the point of view of the side to move
+def evaluate(game):
+	score = game.evaluate()
+	return score if game.color == WHITE else -score
+
+def is_capture(board, move):
+	return board[move.end] != EMPTY or move.kind == EN_PASSANT
+
+# mate scores are stored relative to the node rather than the root, so
+# they stay right when the position turns up again at a different ply
+def score_to_table(score, ply):
+	if score >= MATE - MAX_PLY:
+		return score + ply
+	if score <= -MATE + MAX_PLY:
+		return score - ply
+	return score
+
+def score_from_table(score, ply):
+	if score >= MATE - MAX_PLY:
+		return score - ply
+	if score <= -MATE + MAX_PLY:
+		return score + ply
+	return score
+
+class Search:
+
+	def __init__(self, game, depth=None, time_limit=None, on_iteration=None, table=None, start_depth=1):
+		self.game = game
+		self.table = table if table is not None else TranspositionTable()
+		self.max_depth = min(depth or MAX_PLY, MAX_PLY)
+		self.start_depth = min(start_depth, self.max_depth)
+		self.time_limit = time_limit
+		# called after every completed iteration with (depth, score, nodes, seconds, pv)
+		self.on_iteration = on_iteration
+		# set from another thread to stop the search early
+		self.stopped = False
+		self.nodes = 0
+		self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+		self.history = [0] * (64 * 64)
+		self.pv = [[] for _ in range(MAX_PLY + 1)]
+
+	# Search one ply deeper each iteration until max_depth, the time limit
+	# or a stop. Returns (best move, score) from the deepest completed
+	# iteration; the move is None only if there are no legal moves.
+	def run(self):
+		self.start = time.perf_counter()
+		self.deadline = None if self.time_limit is None else self.start + self.time_limit
+		self.table.new_search()
+		root_moves = list(self.game.legal_moves())
+		if not root_moves:
+			return None, 0
+		best_move = root_moves[0]
+		best_score = 0
+		for depth in range(self.start_depth, self.max_depth + 1):
+			try:
+				score = self.alpha_beta(depth, -INFINITY, INFINITY, 0, best_move)
+			except SearchStopped:
+				break
+			best_move = self.pv[0][0]
+			best_score = score
+			if self.on_iteration:
+				self.on_iteration(depth, score, self.nodes, time.perf_counter() - self.start, list(self.pv[0]))
+			if abs(score) >= MATE - MAX_PLY:
+				break
+		return best_move, best_score
+
+	def count_node(self):
+		self.nodes += 1
+		if self.nodes & 1023 == 0:
+			if self.stopped or (self.deadline is not None and time.perf_counter() >= self.deadline):
+				self.stopped = True
+				raise SearchStopped()
+
+	def alpha_beta(self, depth, alpha, beta, ply, pv_move=None):
+		game = self.game
+		self.pv[ply] = []
+		if ply and game.positions.get(game.key, 0) > 1:
+			return 0
+		in_check = game.is_check()
+		if in_check:
+			depth += 1
+		if depth <= 0 or ply >= MAX_PLY:
+			return self.quiesce(alpha, beta, ply)
+		self.count_node()
+		table_move = None
+		entry = self.table.probe(game.key)
+		if entry is not None:
+			table_move, score, table_depth, flag = entry
+			if ply and table_depth >= depth:
+				score = score_from_table(score, ply)
+				if (flag == EXACT or (flag == LOWER and score >= beta)
+						or (flag == UPPER and score <= alpha)):
+					return score
+		moves = list(game.legal_moves())
+		if not moves:
+			return -MATE + ply if in_check else 0
+		self.order(moves, ply, pv_move, table_move)
+		board = game.board
+		alpha_orig = alpha
+		best = -INFINITY
+		best_move = moves[0]
+		for move in moves:
+			game.push(move)
+			try:
+				score = -self.alpha_beta(depth - 1, -beta, -alpha, ply + 1)
+			finally:
+				game.pop()
+			if score > best:
+				best = score
+				best_move = move
+				if score > alpha:
+					alpha = score
+					self.pv[ply] = [move] + self.pv[ply + 1]
+					if alpha >= beta:
+						if not is_capture(board, move) and not move.prm:
+							self.remember_cutoff(move, depth, ply)
+						break
+		if best <= alpha_orig:
+			flag = UPPER
+		elif best >= beta:
+			flag = LOWER
+		else:
+			flag = EXACT
+		self.table.store(game.key, best_move.code, score_to_table(best, ply), depth, flag)
+		return best
+
+	# only captures and queen promotions are searched, on top of the
+	# static evaluation ("standing pat"), so the search never stops in
+	# the middle of an exchange
+	def quiesce(self, alpha, beta, ply):
+		self.count_node()
+		game = self.game
+		stand_pat = evaluate(game)
+		if stand_pat >= beta or ply >= MAX_PLY:
+			return stand_pat
+		if stand_pat > alpha:
+			alpha = stand_pat
+		board = game.board
+		moves = [move for move in game.legal_moves() if is_capture(board, move) or move.prm == QUEEN]
+		self.order(moves, ply)
+		for move in moves:
+			game.push(move)
+			try:
+				score = -self.quiesce(-beta, -alpha, ply + 1)
+			finally:
+				game.pop()
+			if score >= beta:
+				return score
+			if score > alpha:
+				alpha = score
+		return alpha
+
+	# Best first: the previous iteration's move, then the transposition
+	# table's move, then captures by most valuable victim and least
+	# valuable attacker, then this ply's killer moves, then quiet moves by
+	# history score.
+	def order(self, moves, ply, pv_move=None, table_move=None):
+		board = self.game.board
+		killers = self.killers[ply]
+		history = self.history
+		def score(move):
+			if move == pv_move:
+				return 1 << 41
+			if move.code == table_move:
+				return 1 << 40
+			if move.kind == EN_PASSANT:
+				victim = PAWN
+			else:
+				victim = board[move.end] & TYPE_MASK
+			if victim or move.prm:
+				return (1 << 32) + piece_values[victim] * 16 + piece_values[move.prm] - move.pce
+			if move == killers[0]:
+				return (1 << 31) + 1
+			if move == killers[1]:
+				return 1 << 31
+			return history[move.srt * 64 + move.end]
+		moves.sort(key=score, reverse=True)
+
+	def remember_cutoff(self, move, depth, ply):
+		killers = self.killers[ply]
+		if move != killers[0]:
+			killers[1] = killers[0]
+			killers[0] = move
+		self.history[move.srt * 64 + move.end] += depth * depth
+
+##### Lazy SMP #####
+####################
+
+# One analyze worker: an ordinary search of the position whose
+# transposition table lives in the shared memory block table_name, so
+# what one worker finds the others pick up. Completed iterations are put
+# on results as (worker, depth, score, nodes, seconds, pv),
+# followed by (worker, None, None, nodes, None, None) when it finishes.
+# positions is the root game's repetition history (Game.positions), which
+# the FEN does not carry, so repetitions are seen as in a one-thread search
+def smp_worker(worker, fen, positions, table_name, table_bytes, depth, time_limit, stop, results):
+	shm = shared_memory.SharedMemory(name=table_name)
+	table = TranspositionTable(buffer=shm.buf[:table_bytes])
+	def report(depth, score, nodes, seconds, pv):
+		results.put((worker, depth, score, nodes, seconds, pv))
+	# every other worker skips ahead a ply so they don't all search the
+	# same depth in step
+	game = Game.from_fen(fen)
+	game.positions = dict(positions)
+	search = Search(game, depth, time_limit, report, table, start_depth=1 + worker % 2)
+	def stop_search():
+		stop.wait()
+		search.stopped = True
+	threading.Thread(target=stop_search, daemon=True).start()
+	try:
+		search.run()
+	finally:
+		results.put((worker, None, None, search.nodes, None, None))
+		table.close()
+		shm.close()
+
+# Search game's position with threads worker processes sharing one
+# transposition table of hash_mb megabytes, to depth or for time_limit
+# seconds, or until stop (a threading.Event) is set. on_iteration is
+# called with (depth, score, nodes, seconds, pv) each time some worker
+# completes a deeper iteration than any before. Returns (best move,
+# score, depth) from the deepest iteration; the move is None only if
+# there are no legal moves. stop is always left set.
+def analyze(game, threads, depth=None, time_limit=None, hash_mb=16, on_iteration=None, stop=None):
+	start = time.perf_counter()
+	best = (0, 0, [])
+	if stop is None:
+		stop = threading.Event()
+	if threads <= 1:
+		def report(depth, score, nodes, seconds, pv):
+			nonlocal best
+			best = (depth, score, pv)
+			if on_iteration:
+				on_iteration(depth, score, nodes, seconds, pv)
+		search = Search(game, depth, time_limit, report, TranspositionTable(hash_mb))
+		def stop_search():
+			stop.wait()
+			search.stopped = True
+		threading.Thread(target=stop_search, daemon=True).start()
+		try:
+			search.run()
+		finally:
+			stop.set()
+	else:
+		# workers are spawned rather than forked: a fork copies the locks
+		# other threads hold, such as the one on stdin a UCI loop is
+		# blocked reading, and the worker hangs as soon as it touches one
+		context = multiprocessing.get_context('spawn')
+		table_bytes = TranspositionTable.buffer_size(hash_mb)
+		shm = shared_memory.SharedMemory(create=True, size=table_bytes)
+		try:
+			results = context.Queue()
+			workers_stop = context.Event()
+			def stop_workers():
+				stop.wait()
+				workers_stop.set()
+			threading.Thread(target=stop_workers, daemon=True).start()
+			workers = [context.Process(target=smp_worker,
+				args=(worker, game.to_fen(), game.positions, shm.name, table_bytes, depth, time_limit, workers_stop, results))
+				for worker in range(threads)]
+			for process in workers:
+				process.start()
+			nodes = [0] * threads
+			running = threads
+			try:
+				while running:
+					worker, iteration, score, nodes[worker], seconds, pv = results.get()
+					if iteration is None:
+						# the first worker to finish has either reached the
+						# depth limit, run out of time or found a mate, and
+						# none of those leave anything for the rest to do
+						running -= 1
+						stop.set()
+					elif iteration > best[0]:
+						best = (iteration, score, pv)
+						if on_iteration:
+							on_iteration(iteration, score, sum(nodes), time.perf_counter() - start, pv)
+			finally:
+				stop.set()
+				for process in workers:
+					process.join()
+		finally:
+			shm.close()
+			shm.unlink()
+	depth, score, pv = best
+	# with no iteration completed in time, any legal move beats none
+	return (pv[0] if pv else next(game.legal_moves(), None)), score, depth
@@ -0,0 +1,117 @@
+# Weights and piece-square tables for Game.evaluate, in centipawns.
+#
+# Every list is in piece order pawn, knight, bishop, rook, queen, king.
+# The square tables are written from White's side with rank 8 on the top
+# line, the way a diagram is drawn; game.py mirrors them for Black.
+# Middlegame (mg) and endgame (eg) scores are blended by game phase, which
+# runs from max_phase with all pieces on the board down to 0 with only
+# kings and pawns left.
+
+mg_values = [100, 320, 330, 500, 900, 0]
+eg_values = [120, 300, 320, 520, 920, 0]
+
+phase_weights = [0, 1, 1, 2, 4, 0]
+max_phase = 24
+
+pawn_mg = [
+	  0,  0,  0,  0,  0,  0,  0,  0,
+	 50, 50, 50, 50, 50, 50, 50, 50,
+	 10, 10, 20, 30, 30, 20, 10, 10,
+	  5,  5, 10, 25, 25, 10,  5,  5,
+	  0,  0,  0, 20, 20,  0,  0,  0,
+	  5, -5,-10,  0,  0,-10, -5,  5,
+	  5, 10, 10,-20,-20, 10, 10,  5,
+	  0,  0,  0,  0,  0,  0,  0,  0
+]
+
+pawn_eg = [
+	  0,  0,  0,  0,  0,  0,  0,  0,
+	 80, 80, 80, 80, 80, 80, 80, 80,
+	 50, 50, 50, 50, 50, 50, 50, 50,
+	 30, 30, 30, 30, 30, 30, 30, 30,
+	 15, 15, 15, 15, 15, 15, 15, 15,
+	  5,  5,  5,  5,  5,  5,  5,  5,
+	  0,  0,  0,  0,  0,  0,  0,  0,
+	  0,  0,  0,  0,  0,  0,  0,  0
+]
+
+knight = [
+	-50,-40,-30,-30,-30,-30,-40,-50,
+	-40,-20,  0,  0,  0,  0,-20,-40,
+	-30,  0, 10, 15, 15, 10,  0,-30,
+	-30,  5, 15, 20, 20, 15,  5,-30,
+	-30,  0, 15, 20, 20, 15,  0,-30,
+	-30,  5, 10, 15, 15, 10,  5,-30,
+	-40,-20,  0,  5,  5,  0,-20,-40,
+	-50,-40,-30,-30,-30,-30,-40,-50
+]
+
+bishop = [
+	-20,-10,-10,-10,-10,-10,-10,-20,
+	-10,  0,  0,  0,  0,  0,  0,-10,
+	-10,  0,  5, 10, 10,  5,  0,-10,
+	-10,  5,  5, 10, 10,  5,  5,-10,
+	-10,  0, 10, 10, 10, 10,  0,-10,
+	-10, 10, 10, 10, 10, 10, 10,-10,
+	-10,  5,  0,  0,  0,  0,  5,-10,
+	-20,-10,-10,-10,-10,-10,-10,-20
+]
+
+rook = [
+	  0,  0,  0,  0,  0,  0,  0,  0,
+	  5, 10, 10, 10, 10, 10, 10,  5,
+	 -5,  0,  0,  0,  0,  0,  0, -5,
+	 -5,  0,  0,  0,  0,  0,  0, -5,
+	 -5,  0,  0,  0,  0,  0,  0, -5,
+	 -5,  0,  0,  0,  0,  0,  0, -5,
+	 -5,  0,  0,  0,  0,  0,  0, -5,
+	  0,  0,  0,  5,  5,  0,  0,  0
+]
+
+queen = [
+	-20,-10,-10, -5, -5,-10,-10,-20,
+	-10,  0,  0,  0,  0,  0,  0,-10,
+	-10,  0,  5,  5,  5,  5,  0,-10,
+	 -5,  0,  5,  5,  5,  5,  0, -5,
+	  0,  0,  5,  5,  5,  5,  0, -5,
+	-10,  5,  5,  5,  5,  5,  0,-10,
+	-10,  0,  5,  0,  0,  0,  0,-10,
+	-20,-10,-10, -5, -5,-10,-10,-20
+]
+
+king_mg = [
+	-30,-40,-40,-50,-50,-40,-40,-30,
+	-30,-40,-40,-50,-50,-40,-40,-30,
+	-30,-40,-40,-50,-50,-40,-40,-30,
+	-30,-40,-40,-50,-50,-40,-40,-30,
+	-20,-30,-30,-40,-40,-30,-30,-20,
+	-10,-20,-20,-20,-20,-20,-20,-10,
+	 20, 20,  0,  0,  0,  0, 20, 20,
+	 20, 30, 10,  0,  0, 10, 30, 20
+]
+
+king_eg = [
+	-50,-40,-30,-20,-20,-30,-40,-50,
+	-30,-20,-10,  0,  0,-10,-20,-30,
+	-30,-10, 20, 30, 30, 20,-10,-30,
+	-30,-10, 30, 40, 40, 30,-10,-30,
+	-30,-10, 30, 40, 40, 30,-10,-30,
+	-30,-10, 20, 30, 30, 20,-10,-30,
+	-30,-30,  0,  0,  0,  0,-30,-30,
+	-50,-30,-30,-30,-30,-30,-30,-50
+]
+
+mg_tables = [pawn_mg, knight, bishop, rook, queen, king_mg]
+eg_tables = [pawn_eg, knight, bishop, rook, queen, king_eg]
+
+# pawn structure, as (mg, eg) pairs
+doubled_pawn = (-10, -20)
+isolated_pawn = (-10, -15)
+# passed pawns by how many ranks they have advanced (0 = still on the second rank)
+passed_pawn = [(0, 10), (5, 15), (10, 25), (20, 45), (35, 75), (60, 120)]
+
+# king safety, middlegame only: each pawn on the three files in front of
+# a king that has castled or stayed on its wing, and each of those files
+# with no friendly pawn at all
+pawn_shield = 10
+open_king_file = -20
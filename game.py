@@ -1,4 +1,16 @@
+import json
+import random
 import re
+import sys
+import time
+import argparse
+import itertools
+import multiprocessing
+import os
+import threading
+from collections import deque, namedtuple, OrderedDict
+
+import evaluation
 
 help_message = """Here's how to move. 
 First, enter the piece you are trying to move. 
@@ -30,11 +42,150 @@ If instead you wanted to just promote to a queen and not capture, you should typ
 To castle kingside, type '0-0'. To castle queenside, type '0-0-0'.
 Using either the upper case letter O or the number 0 will be accepted for castling.
 
+Type 'hint' instead of a move to see what was played from this position in the opening book
+(when the game was started with --book).
+
 Press Enter to return....
 """
 
-#ep not working
-#check castling rights, if white castles then dont clear black castling rights
+format_message = "Moves must be in the format <piece><start sq><end sq> (unless castling)."
+
+# The board is a flat bytearray of 64 squares, index i*8 + j where i is the
+# rank (0 = rank 1) and j is the file (0 = a file). Each square holds a small
+# int: the piece type in the low three bits and the colour bit above it, so
+# board[sq] & color is non-zero exactly when the square holds a friendly piece.
+EMPTY = 0
+PAWN = 1
+KNIGHT = 2
+BISHOP = 3
+ROOK = 4
+QUEEN = 5
+KING = 6
+WHITE = 8
+BLACK = 16
+TYPE_MASK = 7
+COLOR_MASK = WHITE | BLACK
+
+# glyphs are only used for display in print_board
+glyphs = [' '] * ((BLACK | KING) + 1)
+for pce, glyph in zip(range(PAWN, KING+1), '♙♘♗♖♕♔'):
+	glyphs[WHITE | pce] = glyph
+for pce, glyph in zip(range(PAWN, KING+1), '♟♞♝♜♛♚'):
+	glyphs[BLACK | pce] = glyph
+
+back_rank = [ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK]
+
+knight_jumps = [(2,1),(1,2),(-1,2),(-2,1),(-2,-1),(-1,-2),(1,-2),(2,-1)]
+king_steps = [(1,0),(1,1),(0,1),(-1,1),(-1,0),(-1,-1),(0,-1),(1,-1)]
+slider_dirs = {
+	BISHOP: [(1,1),(-1,1),(-1,-1),(1,-1)],
+	ROOK: [(1,0),(0,1),(-1,0),(0,-1)],
+	QUEEN: king_steps
+}
+
+def squares_from(sq, steps):
+	i, j = divmod(sq, 8)
+	return [(i+di)*8 + j+dj for di,dj in steps if 0 <= i+di < 8 and 0 <= j+dj < 8]
+
+def ray(sq, di, dj):
+	i, j = divmod(sq, 8)
+	squares = []
+	i += di
+	j += dj
+	while 0 <= i < 8 and 0 <= j < 8:
+		squares.append(i*8 + j)
+		i += di
+		j += dj
+	return squares
+
+# Per-square tables built once at import: the squares a knight or king on
+# sq reaches, the squares a pawn of each colour attacks sq from, and for
+# each slider the squares it passes over in every direction, nearest first
+knight_attacks = [squares_from(sq, knight_jumps) for sq in range(64)]
+king_attacks = [squares_from(sq, king_steps) for sq in range(64)]
+pawn_attackers = {
+	WHITE: [squares_from(sq, [(-1,-1),(-1,1)]) for sq in range(64)],
+	BLACK: [squares_from(sq, [(1,-1),(1,1)]) for sq in range(64)]
+}
+rays = {pce: [[ray(sq, di, dj) for di,dj in dirs] for sq in range(64)] for pce, dirs in slider_dirs.items()}
+
+piece_letters = ' PNBRQK'
+
+# Move.kind values
+NORMAL = 0
+DOUBLE_PUSH = 1
+EN_PASSANT = 2
+CASTLE = 3
+
+def sq_name(sq):
+	return 'abcdefgh'[sq % 8] + str(sq // 8 + 1)
+
+# pce and prm are piece types (prm is EMPTY unless the move promotes),
+# srt and end are board indices; str() gives the move in the input notation
+class Move(namedtuple('Move', ['pce', 'srt', 'end', 'prm', 'kind'], defaults=[EMPTY, NORMAL])):
+	__slots__ = ()
+
+	def __str__(self):
+		if self.kind == CASTLE:
+			return '0-0' if self.end > self.srt else '0-0-0'
+		move_str = piece_letters[self.pce] + sq_name(self.srt) + sq_name(self.end)
+		if self.prm:
+			move_str += '=' + piece_letters[self.prm]
+		return move_str
+
+	# long algebraic notation as used by UCI, e.g. e2e4, e1g1, b2c1n
+	@property
+	def uci(self):
+		return sq_name(self.srt) + sq_name(self.end) + piece_letters[self.prm].strip().lower()
+
+	# 16-bit code: start square, end square and promotion piece, which is
+	# enough to pick the move out of the position's legal moves
+	@property
+	def code(self):
+		return self.srt | self.end << 6 | self.prm << 12
+
+# What Game.status works out about a position: whether the side to move
+# is in check, whether it has a legal move, the squares of the pieces
+# giving check, and the result if the game is over (None otherwise)
+Status = namedtuple('Status', ['in_check', 'has_legal_move', 'checkers', 'result'])
+
+# Zobrist keys: the position key is the xor of one random 64-bit number per
+# (piece, square) plus numbers for the side to move, the castle rights and
+# the en passant file, so a move only has to xor in what it changed
+zobrist = random.Random(20240601)
+zobrist_pieces = [[zobrist.getrandbits(64) for _ in range(64)] if pce & TYPE_MASK else [0]*64 for pce in range(len(glyphs))]
+zobrist_side = zobrist.getrandbits(64)
+zobrist_castle = [zobrist.getrandbits(64) for _ in range(16)]
+zobrist_e_p = [zobrist.getrandbits(64) for _ in range(8)]
+
+# 0 for a dark square, 1 for a light one
+square_colors = bytes((sq // 8 + sq % 8) % 2 for sq in range(64))
+
+# pawns only, for the pawn structure cache
+zobrist_pawns = [row if pce & TYPE_MASK == PAWN else [0]*64 for pce, row in enumerate(zobrist_pieces)]
+
+# Evaluation terms kept up to date move by move: for every piece code and
+# square, the piece's value plus its square bonus, from White's point of
+# view (so negative for Black), once for the middlegame and once for the
+# endgame, and the piece's weight towards the game phase
+mg_scores = [[0]*64 for _ in glyphs]
+eg_scores = [[0]*64 for _ in glyphs]
+phase_weights = [0] * len(glyphs)
+for pce in range(PAWN, KING+1):
+	for sq in range(64):
+		i, j = divmod(sq, 8)
+		# the tables are drawn with rank 8 first, so White reads them upside down
+		white_sq, black_sq = (7-i)*8 + j, sq
+		mg_scores[WHITE | pce][sq] = evaluation.mg_values[pce-1] + evaluation.mg_tables[pce-1][white_sq]
+		eg_scores[WHITE | pce][sq] = evaluation.eg_values[pce-1] + evaluation.eg_tables[pce-1][white_sq]
+		mg_scores[BLACK | pce][sq] = -evaluation.mg_values[pce-1] - evaluation.mg_tables[pce-1][black_sq]
+		eg_scores[BLACK | pce][sq] = -evaluation.eg_values[pce-1] - evaluation.eg_tables[pce-1][black_sq]
+	phase_weights[WHITE | pce] = phase_weights[BLACK | pce] = evaluation.phase_weights[pce-1]
+
+# pawn structure and king shelter scores by pawn_key and king squares,
+# shared by all games; cleared when it gets too big
+pawn_cache = {}
+PAWN_CACHE_SIZE = 1 << 16
 
 def sign(x):
     if x > 0:
@@ -48,39 +199,64 @@ class Game:
 
 	castle_strs = ["0-0","0-0-0","O-O","O-O-O"]
 	cvt_prm_pce = {
-		'Q': ('\u2655','\u265b'),
-		'R': ('\u2656','\u265c'),
-		'B': ('\u2657','\u265d'),
-		'N': ('\u2658','\u265e'),
-		None: (None,None)
+		'Q': QUEEN,
+		'R': ROOK,
+		'B': BISHOP,
+		'N': KNIGHT,
+		None: None
 	}
+	# position key -> frozenset of the legal moves in the input notation,
+	# least recently used first; shared by all games, see is_legal_move
+	legal_move_cache = OrderedDict()
+	legal_move_cache_size = 10000
+	legal_move_cache_lock = threading.Lock()
 
 	def __init__(self):
-		self.board = [
-			['\u2656','\u2658','\u2657','\u2655','\u2654','\u2657','\u2658','\u2656'],
-			['\u2659' for _ in range(8)],
-			[' ' for _ in range(8)],
-			[' ' for _ in range(8)],
-			[' ' for _ in range(8)],
-			[' ' for _ in range(8)],
-			['\u265f' for _ in range(8)],	
-			['\u265c','\u265e','\u265d','\u265b','\u265a','\u265d','\u265e','\u265c']
-		]
-		self.positions = {str(self.board):1}
+		self.board = bytearray(64)
+		for j in range(8):
+			self.board[j] = WHITE | back_rank[j]
+			self.board[8+j] = WHITE | PAWN
+			self.board[48+j] = BLACK | PAWN
+			self.board[56+j] = BLACK | back_rank[j]
 		self.turn = 'White'
+		self.color = WHITE
 		self.white_castle_rights = [True, True] #[short, long]
 		self.black_castle_rights = [True, True]
-		# ...e_p_file holds the file (board[][j]) on which 
+		# ...e_p_file holds the file (j) on which 
 		# the enemy pawn just moved forward two squares
 		self.white_e_p_file = float('inf')
 		self.black_e_p_file = float('inf')
-		self.king = '\u2654'
-		self.king_i = 0
-		self.king_j = 4
+		self.king_sqs = {WHITE: 4, BLACK: 60}
 		self.result = None
-
-	# potentially keep track of move # instead of always clearing ep variables
-	# currently have to always set_e_p_file within each of the make_move functions
+		# Status of the current position, worked out on first use
+		self.cached_status = None
+		# moves validated by make_move wait here until finish_move pushes them
+		self.pending_move = None
+		# one undo record per pushed move, see push
+		self.stack = []
+		# bumped as push and pop start and again as they finish, so it is odd
+		# while the board is changing and a reader on another thread can
+		# tell when the position moved under it
+		self.changes = 0
+		# plies since the last capture or pawn move, and the move number
+		self.halfmove_clock = 0
+		self.fullmove_number = 1
+		# the game ends as soon as a draw could be claimed (threefold
+		# repetition, fifty move rule) rather than only once it is
+		# automatic (fivefold repetition, seventy-five move rule)
+		self.claim_draws = True
+		# transposition table for best_move, created on first use
+		self.table = None
+		# called with every move finish_move plays, e.g. by an archive writer
+		self.recorder = None
+		# opening book for hint, see book.py
+		self.book = None
+		self.key = self.compute_key()
+		# position key -> number of times the position has occurred since
+		# the last capture or pawn move (nothing earlier can come round again)
+		self.positions = {self.key:1}
+		# incremental evaluation terms, see evaluate
+		self.compute_scores()
 
 	def welcome_message(self):
 		print("Welcome to text chess!")
@@ -88,9 +264,13 @@ class Game:
 	def get_move(self):
 		while True:
 			self.print_board()
+			if self.status().in_check:
+				print("{} is in check.".format(self.turn))
 			move_str = input("{}, it's your turn! Please enter your move ('h' for help): ".format(self.turn)).strip()
 			if move_str == 'h':
 				input(help_message)
+			elif move_str == 'hint':
+				print(self.hint())
 			else:
 				if self.is_well_formed(move_str):
 					# breakpoint()
@@ -100,16 +280,31 @@ class Game:
 					else:
 						break
 				else:
-					print("Moves must be in the format <piece><start sq><end sq> (unless castling). Please try again.")
+					print(format_message + " Please try again.")
 		self.finish_move()
 
+	# the opening book's moves for this position, most played first
+	def hint(self):
+		from book import score
+		if self.book is None:
+			return "No opening book is loaded."
+		book_moves = self.book.lookup(self.key)
+		if not book_moves:
+			return "This position is not in the opening book."
+		lines = ["Book moves:"]
+		for book_move in book_moves[:5]:
+			move_score = score(book_move)
+			lines.append("  {:<9} played {} times{}".format(str(self.move_from_code(book_move.code)), book_move.games,
+				'' if move_score is None else ", scoring {:.0%}".format(move_score)))
+		return '\n'.join(lines)
+
 	def is_well_formed(self, text):
 		pattern = "^[KQRBNP]([a-h][1-8]){2}((?<=^P.{4})=[QRBN])?$"
 		return text in self.castle_strs or re.search(pattern, text)
 
 	def make_move(self, move_str):
 		if move_str in self.castle_strs:
-			if self.is_check():
+			if self.status().in_check:
 				return "You're in check; castling is not allowed."
 			else:
 				return self.make_castle_move(move_str)
@@ -117,7 +312,7 @@ class Game:
 			if move_str[1:3] != move_str[3:5]:
 				pce = move_str[0]
 				if len(move_str) > 5:
-					return make_pawn_move(*self.process_move_sqs(move_str[1:5]), move_str[6])
+					return self.make_pawn_move(*self.process_move_sqs(move_str[1:5]), move_str[6])
 				else:
 					return {
 						"K": self.make_king_move,
@@ -134,12 +329,11 @@ class Game:
 		return (int(squares_str[1])-1, ord(squares_str[0])-97, int(squares_str[3])-1, ord(squares_str[2])-97)
 
 	def make_castle_move(self, move_str):
-		if self.king == '\u2654':
+		if self.color == WHITE:
 			rights = self.white_castle_rights
-			rook = '\u2656'
 		else:
 			rights = self.black_castle_rights
-			rook = '\u265c'
+		king_sq = self.king_sqs[self.color]
 		if move_str in ["0-0","O-O"]:
 			d_file = 1
 			spaces = 2
@@ -149,24 +343,12 @@ class Game:
 			spaces = 3
 			right = rights[1]
 		if right:
-			if all([self.board[self.king_i][self.king_j + (dj+1)*d_file] == ' ' for dj in range(spaces)]):
-				can_castle = True
-				for _ in range(2):
-					self.board[self.king_i][self.king_j] = ' '
-					self.king_j += d_file
-					self.board[self.king_i][self.king_j] = self.king
-					can_castle = can_castle and not self.is_check()
-				if can_castle:
-					self.board[self.king_i][self.king_j + d_file*(spaces-1)] = ' '
-					self.board[self.king_i][self.king_j - d_file] = rook
-					rights[0] = False
-					rights[1] = False
-					self.set_e_p_file()
+			if all([self.board[king_sq + (dj+1)*d_file] == EMPTY for dj in range(spaces)]):
+				move = Move(KING, king_sq, king_sq + 2*d_file, EMPTY, CASTLE)
+				if self.is_safe_move(move):
+					self.pending_move = move
 					return ''
 				else:
-					self.board[self.king_i][self.king_j] = ' '
-					self.king_j -= 2*d_file
-					self.board[self.king_i][self.king_j] = self.king
 					return "You cannot castle through check."
 			else:
 				return "You cannot castle because there are pieces in the way."
@@ -174,30 +356,14 @@ class Game:
 			return "You lost castle rights by moving your king or rook on a previous turn."
 
 	def make_king_move(self, srt_i, srt_j, end_i, end_j):
-		if self.king == '\u2654':
-			rights = self.white_castle_rights
-			frly_pcs = ['\u2655','\u2656','\u2657','\u2658','\u2659']
-		else:
-			rights = self.black_castle_rights
-			frly_pcs = ['\u265b','\u265c','\u265d','\u265e','\u265f']
-		if self.king_i == srt_i and self.king_j == srt_j:
+		if self.king_sqs[self.color] == srt_i*8 + srt_j:
 			if abs(end_i - srt_i) <= 1 and abs(end_j - srt_j) <= 1:
-				if self.board[end_i][end_j] not in frly_pcs:
-					self.board[self.king_i][self.king_j] = ' '
-					self.king_i = end_i
-					self.king_j = end_j
-					old_pce = self.board[self.king_i][self.king_j]
-					self.board[self.king_i][self.king_j] = self.king
-					if not self.is_king_check() and not self.is_check():
-						rights[0] = False
-						rights[1] = False
-						self.set_e_p_file()
+				if not self.board[end_i*8 + end_j] & self.color:
+					move = Move(KING, srt_i*8 + srt_j, end_i*8 + end_j)
+					if self.is_safe_move(move):
+						self.pending_move = move
 						return ""
 					else:
-						self.board[self.king_i][self.king_j] = old_pce
-						self.king_i = srt_i
-						self.king_j = srt_j
-						self.board[self.king_i][self.king_j] = self.king
 						return "King cannot move into check."
 				else:
 					return "King cannot move to square with a friendly piece on it."
@@ -206,37 +372,33 @@ class Game:
 		else:
 			return "King is not on the specified starting move square."
 
+	# shared by the queen, rook and bishop moves: are all squares strictly
+	# between srt and end empty, and is end free of friendly pieces
+	def is_clear_path(self, srt_i, srt_j, end_i, end_j):
+		di = sign(end_i-srt_i)
+		dj = sign(end_j-srt_j)
+		step = di*8 + dj
+		end = end_i*8 + end_j
+		if self.board[end] & self.color:
+			return False
+		sq = srt_i*8 + srt_j + step
+		while sq != end:
+			if self.board[sq] != EMPTY:
+				return False
+			sq += step
+		return True
+
 	def make_queen_move(self, srt_i, srt_j, end_i, end_j):
-		if self.king == '\u2654':
-			queen = '\u2655'
-			frly_pcs = ['\u2654','\u2655','\u2656','\u2657','\u2658','\u2659']
-		else:
-			queen = '\u265b'
-			frly_pcs = ['\u265a','\u265b','\u265c','\u265d','\u265e','\u265f']
-		if self.board[srt_i][srt_j] == queen:
+		if self.board[srt_i*8 + srt_j] == self.color | QUEEN:
 			di = end_i-srt_i
 			dj = end_j-srt_j
 			if di == 0 or dj == 0 or abs(di) == abs(dj):
-				no_pce_blk = True
-				sqr_is = range(end_i, srt_i, -sign(di)) if di != 0 else [end_i]*abs(dj)
-				sqr_js = range(end_j, srt_j, -sign(dj)) if dj != 0 else [end_j]*abs(di)
-				for i,j in zip(sqr_is, sqr_js):
-					if self.board[i][j] in frly_pcs:
-						no_pce_blk = False
-						break
-					elif self.board[i][j] != ' ' and (i != end_i or j != end_j):
-						no_pce_blk = False
-						break
-				if no_pce_blk:
-					self.board[srt_i][srt_j] = ' '
-					old_pce = self.board[end_i][end_j]
-					self.board[end_i][end_j] = queen
-					if not self.is_check():
-						self.set_e_p_file()
+				if self.is_clear_path(srt_i, srt_j, end_i, end_j):
+					move = Move(QUEEN, srt_i*8 + srt_j, end_i*8 + end_j)
+					if self.is_safe_move(move):
+						self.pending_move = move
 						return ""
 					else:
-						self.board[end_i][end_j] = old_pce
-						self.board[srt_i][srt_j] = queen
 						return "Queen cannot make a move that leaves own king in check."
 				else:
 					return "Queen cannot jump over pieces or land in a square occupied by a friendly piece."
@@ -246,42 +408,16 @@ class Game:
 			return "There is no queen on the specified starting move square."
 
 	def make_rook_move(self, srt_i, srt_j, end_i, end_j):
-		if self.king == '\u2654':
-			rook = '\u2656'
-			frly_pcs = ['\u2654','\u2655','\u2656','\u2657','\u2658','\u2659']
-			rights = self.white_castle_rights
-		else:
-			rook = '\u265c'
-			frly_pcs = ['\u265a','\u265b','\u265c','\u265d','\u265e','\u265f']
-			rights = self.black_castle_rights
-		if self.board[srt_i][srt_j] == rook:
+		if self.board[srt_i*8 + srt_j] == self.color | ROOK:
 			di = end_i-srt_i
 			dj = end_j-srt_j
 			if di == 0 or dj == 0:
-				no_pce_blk = True
-				sqr_is = range(end_i, srt_i, -sign(di)) if di != 0 else [end_i]*abs(dj)
-				sqr_js = range(end_j, srt_j, -sign(dj)) if dj != 0 else [end_j]*abs(di)
-				for i,j in zip(sqr_is, sqr_js):
-					if self.board[i][j] in frly_pcs:
-						no_pce_blk = False
-						break
-					elif self.board[i][j] != ' ' and (i != end_i or j != end_j):
-						no_pce_blk = False
-						break
-				if no_pce_blk:
-					self.board[srt_i][srt_j] = ' '
-					old_pce = self.board[end_i][end_j]
-					self.board[end_i][end_j] = rook
-					if not self.is_check():
-						if srt_j == 7:
-							rights[0] = False
-						elif srt_j == 0:
-							rights[1] = False
-						self.set_e_p_file()
+				if self.is_clear_path(srt_i, srt_j, end_i, end_j):
+					move = Move(ROOK, srt_i*8 + srt_j, end_i*8 + end_j)
+					if self.is_safe_move(move):
+						self.pending_move = move
 						return ""
 					else:
-						self.board[end_i][end_j] = old_pce
-						self.board[srt_i][srt_j] = rook
 						return "Rook cannot make a move that leaves own king in check."
 				else:
 					return "Rook cannot jump over pieces or land in a square occupied by a friendly piece."
@@ -291,36 +427,16 @@ class Game:
 			return "There is no rook on the specified starting move square."
 
 	def make_bishop_move(self, srt_i, srt_j, end_i, end_j):
-		if self.king == '\u2654':
-			bishop = '\u2657'
-			frly_pcs = ['\u2654','\u2655','\u2656','\u2657','\u2658','\u2659']
-		else:
-			bishop = '\u265d'
-			frly_pcs = ['\u265a','\u265b','\u265c','\u265d','\u265e','\u265f']
-		if self.board[srt_i][srt_j] == bishop:
+		if self.board[srt_i*8 + srt_j] == self.color | BISHOP:
 			di = end_i-srt_i
 			dj = end_j-srt_j
 			if abs(di) == abs(dj):
-				no_pce_blk = True
-				sqr_is = range(end_i, srt_i, -sign(di))
-				sqr_js = range(end_j, srt_j, -sign(dj))
-				for i,j in zip(sqr_is, sqr_js):
-					if self.board[i][j] in frly_pcs:
-						no_pce_blk = False
-						break
-					elif self.board[i][j] != ' ' and (i != end_i or j != end_j):
-						no_pce_blk = False
-						break
-				if no_pce_blk:
-					self.board[srt_i][srt_j] = ' '
-					old_pce = self.board[end_i][end_j]
-					self.board[end_i][end_j] = bishop
-					if not self.is_check():
-						self.set_e_p_file()
+				if self.is_clear_path(srt_i, srt_j, end_i, end_j):
+					move = Move(BISHOP, srt_i*8 + srt_j, end_i*8 + end_j)
+					if self.is_safe_move(move):
+						self.pending_move = move
 						return ""
 					else:
-						self.board[end_i][end_j] = old_pce
-						self.board[srt_i][srt_j] = bishop
 						return "Bishop cannot make a move that leaves own king in check."
 				else:
 					return "Bishop cannot jump over pieces or land in a square occupied by a friendly piece."
@@ -330,24 +446,14 @@ class Game:
 			return "There is no bishop on the specified starting move square."
 
 	def make_knight_move(self, srt_i, srt_j, end_i, end_j):
-		if self.king == '\u2654':
-			knight = '\u2658'
-			frly_pcs = ['\u2654','\u2655','\u2656','\u2657','\u2658','\u2659']
-		else:
-			knight = '\u265e'
-			frly_pcs = ['\u265a','\u265b','\u265c','\u265d','\u265e','\u265f']
-		if self.board[srt_i][srt_j] == knight:
-			if (end_i-srt_i, end_j-srt_j) in [(2,1),(1,2),(-1,2),(-2,1),(-2,-1),(-1,-2),(1,-2),(2,-1)]:
-				if self.board[end_i][end_j] not in frly_pcs:
-					self.board[srt_i][srt_j] = ' '
-					old_pce = self.board[end_i][end_j]
-					self.board[end_i][end_j] = knight
-					if not self.is_check():
-						self.set_e_p_file()
+		if self.board[srt_i*8 + srt_j] == self.color | KNIGHT:
+			if (end_i-srt_i, end_j-srt_j) in knight_jumps:
+				if not self.board[end_i*8 + end_j] & self.color:
+					move = Move(KNIGHT, srt_i*8 + srt_j, end_i*8 + end_j)
+					if self.is_safe_move(move):
+						self.pending_move = move
 						return ""
 					else:
-						self.board[end_i][end_j] = old_pce
-						self.board[srt_i][srt_j] = knight
 						return "Knight cannot make a move that leaves own king in check."
 				else:
 					return "Knight cannot move to square with a friendly piece on it."
@@ -357,53 +463,41 @@ class Game:
 			return "There is no knight on the specified starting move square."
 
 	def make_pawn_move(self, srt_i, srt_j, end_i, end_j, prm_pce=None):
-		if self.king == '\u2654':
-			pawn = '\u2659'
-			eny_pcs = ['\u265b','\u265c','\u265d','\u265e','\u265f']
+		eny_color = self.color ^ COLOR_MASK
+		if self.color == WHITE:
 			srt_r = 1
 			prm_r = 7
 			dir_r = 1
-			prm_pce = self.cvt_prm_pce[prm_pce][0]
+			e_p_file = self.white_e_p_file
 		else:
-			pawn = '\u265f'
-			eny_pcs = ['\u2655','\u2656','\u2657','\u2658','\u2659']
 			srt_r = 6
 			prm_r = 0
 			dir_r = -1
-			prm_pce = self.cvt_prm_pce[prm_pce][1]
+			e_p_file = self.black_e_p_file
+		prm_pce = self.cvt_prm_pce[prm_pce]
 		if prm_pce is not None:
 			if end_i != prm_r:
 				return "Pawns cannot promote until they reach the final rank."
 		if end_i == prm_r:
 			if prm_pce is None:
 				return "Pawns must promote if they reach the final rank."
-		if self.board[srt_i][srt_j] == pawn:
+		srt = srt_i*8 + srt_j
+		end = end_i*8 + end_j
+		move = None
+		if self.board[srt] == self.color | PAWN:
 			di = end_i-srt_i
 			dj = end_j-srt_j
 			if di == dir_r:
 				if dj == 0:
-					if self.board[end_i][end_j] == ' ':
-						self.board[srt_i][srt_j] = ' '
-						self.board[end_i][end_j] = pawn if end_i != prm_r else prm_pce
-						if not self.is_check():
-							self.set_e_p_file()
-							return ""
-						else:
-							self.board[end_i][end_j] = ' '
-							self.board[srt_i][srt_j] = pawn
-							return "Pawn cannot make a move that leaves own king in check."
+					if self.board[end] == EMPTY:
+						move = Move(PAWN, srt, end, prm_pce or EMPTY)
+					else:
+						return "Pawn cannot move forward if blocked by other pieces."
 				elif abs(dj) == 1:
-					if self.board[end_i][end_j] in eny_pcs:
-						self.board[srt_i][srt_j] = ' '
-						old_pce = self.board[end_i][end_j]
-						self.board[end_i][end_j] = pawn if end_i != prm_r else prm_pce
-						if not self.is_check():
-							self.set_e_p_file()
-							return ""
-						else:
-							self.board[end_i][end_j] = old_pce
-							self.board[srt_i][srt_j] = pawn
-							return "Pawn cannot make a move that leaves own king in check."
+					if self.board[end] & eny_color and self.board[end] & TYPE_MASK != KING:
+						move = Move(PAWN, srt, end, prm_pce or EMPTY)
+					elif self.board[end] == EMPTY and end_j == e_p_file and srt_i == srt_r + 3*dir_r:
+						move = Move(PAWN, srt, end, EMPTY, EN_PASSANT)
 					else:
 						return "Pawns cannot move forward diagonally unless they are capturing an enemy piece."
 				else:
@@ -411,17 +505,8 @@ class Game:
 			elif di == 2*dir_r:
 				if srt_i == srt_r:
 					if dj == 0:
-						# breakpoint()
-						if self.board[srt_i+dir_r][end_j] == ' ' and self.board[end_i][end_j] == ' ':
-							self.board[srt_i][srt_j] = ' '
-							self.board[end_i][end_j] = pawn
-							if not self.is_check():
-								self.set_e_p_file(end_j)
-								return ""
-							else:
-								self.board[end_i][end_j] = ' '
-								self.board[srt_i][srt_j] = pawn
-								return "Pawn cannot make a move that leaves own king in check."
+						if self.board[srt + dir_r*8] == EMPTY and self.board[end] == EMPTY:
+							move = Move(PAWN, srt, end, EMPTY, DOUBLE_PUSH)
 						else:
 							return "Pawn cannot move forward if blocked by other pieces."
 					else:
@@ -432,175 +517,164 @@ class Game:
 				return "Pawns can only move forward one square, unless moving two squares forward on their first move."
 		else:
 			return "There is no pawn on the specified starting move square."
-		# valid piece move (can piece move to target square)
-			# is file the same
-				# is it 1 rank change
-				# is it 2
-					# is it on starting sq
-				# accessible piece move (anything blockign piece moving to target square)
-			# is file one different
-				# is there enemy piece there
-				# is it en passant
-		# does move result in check
-		# if promotion, is 7 and 8 rank
-		#update en passant if successful
-
-	def set_e_p_file(self, file=None):
-		if self.king == '\u2654':
-			self.white_e_p_file = float('inf') if file is None else file
+		if self.is_safe_move(move):
+			self.pending_move = move
+			return ""
 		else:
-			self.black_e_p_file = float('inf') if file is None else file
+			return "Pawn cannot make a move that leaves own king in check."
 
-	def is_over(self):
-		if self.is_checkmate():
-			if self.turn == 'White':
-				self.result = '0-1'
+	# put a move that is known to be legal on the board, keeping castle
+	# rights, the en passant files, the king squares and the position key
+	# up to date; the turn itself is handed over by switch_turn
+	def apply_move(self, move):
+		board = self.board
+		keys = zobrist_pieces
+		key = self.key ^ self.e_p_key() ^ zobrist_castle[self.castle_index()]
+		pce = board[move.srt]
+		old_pce = board[move.end]
+		key ^= keys[pce][move.srt] ^ keys[old_pce][move.end]
+		pawn_key = self.pawn_key ^ zobrist_pawns[pce][move.srt] ^ zobrist_pawns[old_pce][move.end]
+		mg = self.mg - mg_scores[pce][move.srt] - mg_scores[old_pce][move.end]
+		eg = self.eg - eg_scores[pce][move.srt] - eg_scores[old_pce][move.end]
+		self.phase -= phase_weights[old_pce]
+		if old_pce:
+			self.piece_counts[old_pce] -= 1
+			if old_pce & TYPE_MASK == BISHOP:
+				self.bishop_squares[square_colors[move.end]] -= 1
+		board[move.srt] = EMPTY
+		if move.kind == EN_PASSANT:
+			cap_sq = move.end - 8 if self.color == WHITE else move.end + 8
+			old_pce = board[cap_sq]
+			self.piece_counts[old_pce] -= 1
+			key ^= keys[old_pce][cap_sq]
+			pawn_key ^= zobrist_pawns[old_pce][cap_sq]
+			mg -= mg_scores[old_pce][cap_sq]
+			eg -= eg_scores[old_pce][cap_sq]
+			board[cap_sq] = EMPTY
+		elif move.kind == CASTLE:
+			if move.end > move.srt:
+				rook_srt, rook_end = move.end + 1, move.end - 1
 			else:
-				self.result = '1-0'
-			return True
-		elif self.is_stalemate():
-			self.result = '1/2-1/2'
-			return True
-		elif self.is_threefold_repetition():
-			self.result = '1/2-1/2'
-			return True
-		elif self.is_fifty_move_rule():
-			self.result = '1/2-1/2'
-			return True
-		elif self.is_dead_position():
-			self.result = '1/2-1/2'
-			return True
-		return False
+				rook_srt, rook_end = move.end - 2, move.end + 1
+			rook = board[rook_srt]
+			key ^= keys[rook][rook_srt] ^ keys[rook][rook_end]
+			mg += mg_scores[rook][rook_end] - mg_scores[rook][rook_srt]
+			eg += eg_scores[rook][rook_end] - eg_scores[rook][rook_srt]
+			board[rook_srt] = EMPTY
+			board[rook_end] = rook
+		if move.prm:
+			self.piece_counts[pce] -= 1
+			pce = self.color | move.prm
+			self.piece_counts[pce] += 1
+			if move.prm == BISHOP:
+				self.bishop_squares[square_colors[move.end]] += 1
+			self.phase += phase_weights[pce]
+		board[move.end] = pce
+		key ^= keys[pce][move.end]
+		self.pawn_key = pawn_key ^ zobrist_pawns[pce][move.end]
+		self.mg = mg + mg_scores[pce][move.end]
+		self.eg = eg + eg_scores[pce][move.end]
+		if move.pce == KING:
+			self.king_sqs[self.color] = move.end
+		self.set_e_p_file(move.end % 8 if move.kind == DOUBLE_PUSH else None)
+		self.update_castle_rights()
+		self.key = key ^ zobrist_castle[self.castle_index()]
 
-	def is_checkmate(self):
-		if not self.is_check():
-			return False
-		else:
-			if self.has_move():
-				return False
-			else:
-				return True
-
-	def is_stalemate(self):
-		if self.is_check():
-			return False
+	# called by apply_move: en passant is only available to the
+	# enemy on the very next move, so the mover's own file is always cleared
+	def set_e_p_file(self, file=None):
+		if self.color == WHITE:
+			self.white_e_p_file = float('inf')
+			self.black_e_p_file = float('inf') if file is None else file
 		else:
-			if self.has_move():
-				return False
-			else:
-				return True
-
-	def is_check(self):
-		if self.is_pawn_check():
-			return True
-		elif self.is_knight_check():
-			return True
-		elif self.is_bishop_check():
-			return True
-		elif self.is_rook_check():
-			return True
-		elif self.is_queen_check():
-			return True
-		return False
+			self.black_e_p_file = float('inf')
+			self.white_e_p_file = float('inf') if file is None else file
 
+	# a king or rook that has left its home square (moved or been captured)
+	# loses the corresponding castle rights for good
+	def update_castle_rights(self):
+		for rights, home, color in ((self.white_castle_rights, 0, WHITE), (self.black_castle_rights, 56, BLACK)):
+			if self.board[home+4] != color | KING:
+				rights[0] = False
+				rights[1] = False
+			if self.board[home+7] != color | ROOK:
+				rights[0] = False
+			if self.board[home] != color | ROOK:
+				rights[1] = False
 
-	##### is_check subroutines #####
-	################################
+	def is_over(self):
+		result = self.status().result
+		if result is not None:
+			self.result = result
+		return result is not None
 
-	def is_pawn_check(self):
-		if self.king == '\u2654':
-			eny_pawn = '\u265f'
-			d_rank = 1
-		else:
-			eny_pawn = '\u2659'
-			d_rank = -1
-		for di,dj in [(1,-1),(1,1)]:
-			i = self.king_i + d_rank*di
-			j = self.king_j + dj
-			if i in range(8) and j in range(8):
-				if self.board[i][j] == eny_pawn:
-					return True
-		return False
+	# Everything is_over, make_move and the display need to know about the
+	# position, from a single pass over checks, pins and legal moves. It is
+	# kept until the position changes: push clears it and pop restores the
+	# previous position's.
+	def status(self):
+		status = self.cached_status
+		if status is None:
+			checks = self.checks_and_pins(self.color)
+			# the checker is the one occupied square on each line of check
+			checkers = [next(sq for sq in block if self.board[sq]) for block in checks[0]]
+			has_legal_move = next(self.legal_moves(checks), None) is not None
+			if not has_legal_move:
+				if not checkers:
+					result = '1/2-1/2'
+				elif self.color == WHITE:
+					result = '0-1'
+				else:
+					result = '1-0'
+			elif (self.is_fivefold_repetition() or self.is_seventy_five_move_rule()
+					or (self.claim_draws and (self.is_threefold_repetition() or self.is_fifty_move_rule()))
+					or self.is_dead_position()):
+				result = '1/2-1/2'
+			else:
+				result = None
+			status = self.cached_status = Status(bool(checkers), has_legal_move, checkers, result)
+		return status
 
-	def is_knight_check(self):
-		if self.king == '\u2654':
-			eny_knight = '\u265e'
-		else:
-			eny_knight = '\u2658'
-		for di,dj in [(2,1),(1,2),(-1,2),(-2,1),(-2,-1),(-1,-2),(1,-2),(2,-1)]:
-			i = self.king_i + di
-			j = self.king_j + dj
-			if i in range(8) and j in range(8):
-				if self.board[i][j] == eny_knight:
-					return True
-		return False
+	def is_checkmate(self):
+		status = self.status()
+		return status.in_check and not status.has_legal_move
 
-	def is_rook_check(self):
-		if self.king == '\u2654':
-			eny_rook = '\u265c'
-		else:
-			eny_rook = '\u2656'
-		for di,dj in [(0,1), (1,0), (-1,0), (0,-1)]:
-			for d in range(7):
-				i = self.king_i + di*(d+1)
-				j = self.king_j + dj*(d+1)
-				if i in range(8) and j in range(8):
-					if self.board[i][j] == eny_rook:
-						return True
-					elif self.board[i][j] != ' ':
-						break
-				else:
-					break
-		return False
+	def is_stalemate(self):
+		status = self.status()
+		return not status.in_check and not status.has_legal_move
 
-	def is_bishop_check(self):
-		if self.king == '\u2654':
-			eny_bishop = '\u265d'
-		else:
-			eny_bishop = '\u2657'
-		for di,dj in [(1,1), (1,-1), (-1,1), (-1,-1)]:
-			for d in range(7):
-				i = self.king_i + di*(d+1)
-				j = self.king_j + dj*(d+1)
-				if i in range(8) and j in range(8):
-					if self.board[i][j] == eny_bishop:
-						return True
-					elif self.board[i][j] != ' ':
-						break
-				else:
-					break
-		return False
+	# is color's king attacked (by default the king of the side to move)
+	def is_check(self, color=None):
+		color = color or self.color
+		return self.is_attacked(self.king_sqs[color], color ^ COLOR_MASK)
 
-	def is_queen_check(self):
-		if self.king == '\u2654':
-			eny_queen = '\u265b'
-		else:
-			eny_queen = '\u2655'
-		paths = []
-		for di,dj in [(1,0),(1,1),(0,1),(-1,1),(-1,0),(-1,-1),(0,-1),(1,-1)]:
-			for d in range(7):
-				i = self.king_i + di*(d+1)
-				j = self.king_j + dj*(d+1)
-				if i in range(8) and j in range(8):
-					if self.board[i][j] == eny_queen:
-						return True
-					elif self.board[i][j] != ' ':
+	# is sq attacked by any piece of by_color; each rook and bishop line is
+	# walked once, and the first piece on it counts if it is that slider or
+	# a queen. A friendly piece about to leave the square vacated is seen
+	# through, as if it had gone.
+	def is_attacked(self, sq, by_color, vacated=None):
+		board = self.board
+		pce = by_color | KNIGHT
+		for sq_ in knight_attacks[sq]:
+			if board[sq_] == pce:
+				return True
+		pce = by_color | PAWN
+		for sq_ in pawn_attackers[by_color][sq]:
+			if board[sq_] == pce:
+				return True
+		queen = by_color | QUEEN
+		for slider in (ROOK, BISHOP):
+			pce = by_color | slider
+			for line in rays[slider][sq]:
+				for sq_ in line:
+					if board[sq_] != EMPTY and sq_ != vacated:
+						if board[sq_] == pce or board[sq_] == queen:
+							return True
 						break
-				else:
-					break
-		return False
-
-	def is_king_check(self):
-		if self.king == '\u2654':
-			eny_king = '\u265a'
-		else:
-			eny_king = '\u2654'
-		for di,dj in [(1,0),(1,1),(0,1),(-1,1),(-1,0),(-1,-1),(0,-1),(1,-1)]:
-			i = self.king_i + di
-			j = self.king_j + dj
-			if i in range(8) and j in range(8):
-				if self.board[i][j] == eny_king:
-					return True
+		pce = by_color | KING
+		for sq_ in king_attacks[sq]:
+			if board[sq_] == pce:
+				return True
 		return False
 
 
@@ -608,264 +682,227 @@ class Game:
 	#################################################
 
 	def has_move(self):
-		if self.has_king_move():
-			return True
-		if self.has_nonking_move():
+		for _ in self.legal_moves():
 			return True
 		return False
-		
-	def has_king_move(self):
-		if self.king == '\u2654':
-			eny_pcs = ['\u265b','\u265c','\u265d','\u265e','\u265f']
-		else:
-			eny_pcs = ['\u2655','\u2656','\u2657','\u2658','\u2659']
-		has_legal_move = False
-		for di,dj in [(1,0),(1,1),(0,1),(-1,1),(-1,0),(-1,-1),(0,-1),(1,-1)]:
-			i = self.king_i + di
-			j = self.king_j + dj
-			if i in range(8) and j in range(8):
-				old_pce = self.board[i][j]
-				if old_pce in eny_pcs + [' ']:
-					self.board[self.king_i][self.king_j] = ' '
-					self.king_i += di
-					self.king_j += dj
-					self.board[self.king_i][self.king_j] = self.king
-					if not self.is_king_check() and not self.is_check():
-						has_legal_move = True
-					self.board[self.king_i][self.king_j] = old_pce
-					self.king_i -= di
-					self.king_j -= dj
-					self.board[self.king_i][self.king_j] = self.king
-					if has_legal_move:
-						return True
-		return False
 
-	def has_nonking_move(self):
-		if self.king == '\u2654':
-			frly_pcs = ['\u2655','\u2656','\u2657','\u2658','\u2659']
-		else:
-			frly_pcs = ['\u265b','\u265c','\u265d','\u265e','\u265f']
-		for i in range(8):
-			for j in range(8):
-				if self.board[i][j] in frly_pcs:
-					if self.board[i][j] in ['\u2655','\u265b']:
-						if self.has_queen_move(i,j):
-							return True
-					elif self.board[i][j] in ['\u2656','\u265c']:
-						if self.has_rook_move(i,j):
-							return True
-					elif self.board[i][j] in ['\u2657','\u265d']:
-						if self.has_bishop_move(i,j):
-							return True
-					elif self.board[i][j] in ['\u2658','\u265e']:
-						if self.has_knight_move(i,j):
-							return True
-					elif self.board[i][j] in ['\u2659','\u265f']:
-						if self.has_pawn_move(i,j):
-							return True
-		return False
+	##### legal move generation #####
+	#################################
 
-	def has_queen_move(self,i,j):
-		if self.king == '\u2654':
-			queen = '\u2655'
-			frly_pcs = ['\u2654','\u2655','\u2656','\u2657','\u2658','\u2659']
-		else:
-			queen = '\u265b'
-			frly_pcs = ['\u265a','\u265b','\u265c','\u265d','\u265e','\u265f']
-		has_legal_move = False
-		last_in_radius = False
-		for di,dj in [(1,0),(1,1),(0,1),(-1,1),(-1,0),(-1,-1),(0,-1),(1,-1)]:
-			for d in range(7):
-				i_ = i + di*(d+1)
-				j_ = j + dj*(d+1)
-				if i_ in range(8) and j_ in range(8):
-					old_pce = self.board[i_][j_]
-					if old_pce in frly_pcs:
-						break
-					if old_pce != ' ':
-						last_in_radius = True
-					self.board[i_][j_] = queen
-					self.board[i][j] = ' '
-					if not self.is_check():
-						legal_move = True
-					self.board[i_][j_] = old_pce
-					self.board[i][j] = queen
-					if has_legal_move:
-						return True
-					if last_in_radius:
-						break
-				else:
-					break
-		return False
+	# Every legal move for the side to move. Checkers and pins are found once
+	# up front, so apart from king moves (checked against is_attacked) and en
+	# passant (tried on the board) no move has to be played to be validated.
+	# The king's moves come first so has_move usually stops early. checks
+	# is checks_and_pins for the side to move, if the caller already has it.
+	def legal_moves(self, checks=None):
+		board = self.board
+		color = self.color
+		king_sq = self.king_sqs[color]
+		checkers, pins = checks or self.checks_and_pins(color)
+		for move in self.piece_moves(*divmod(king_sq, 8)):
+			if self.is_safe_move(move):
+				yield move
+		if len(checkers) > 1:
+			return
+		# when in check every other move must capture the checker or block it
+		evasions = checkers[0] if checkers else None
+		for sq in range(64):
+			if board[sq] & color and sq != king_sq:
+				pinned_to = pins.get(sq)
+				for move in self.piece_moves(*divmod(sq, 8)):
+					if move.kind == EN_PASSANT:
+						if self.is_safe_move(move):
+							yield move
+						continue
+					if evasions is not None and move.end not in evasions:
+						continue
+					if pinned_to is not None and move.end not in pinned_to:
+						continue
+					yield move
 
-	def has_rook_move(self,i,j):
-		if self.king == '\u2654':
-			rook = '\u2656'
-			frly_pcs = ['\u2654','\u2655','\u2656','\u2657','\u2658','\u2659']
-		else:
-			rook = '\u265c'
-			frly_pcs = ['\u265a','\u265b','\u265c','\u265d','\u265e','\u265f']
-		has_legal_move = False
-		last_in_radius = False
-		for di,dj in [(1,0),(0,1),(-1,0),(0,-1)]:
-			for d in range(7):
-				i_ = i + di*(d+1)
-				j_ = j + dj*(d+1)
-				if i_ in range(8) and j_ in range(8):
-					old_pce = self.board[i_][j_]
-					if old_pce in frly_pcs:
-						break
-					if old_pce != ' ':
-						last_in_radius = True
-					self.board[i_][j_] = rook
-					self.board[i][j] = ' '
-					if not self.is_check():
-						legal_move = True
-					self.board[i_][j_] = old_pce
-					self.board[i][j] = rook
-					if has_legal_move:
-						return True
-					if last_in_radius:
-						break
-				else:
+	# Look outwards from color's king. Returns a list with, for each enemy
+	# piece giving check, the set of squares that would stop that check
+	# (the checker's square and any squares between it and the king), and
+	# a dict mapping each pinned friendly piece's square to the squares it
+	# may still move to (along the pin up to and including the pinner).
+	def checks_and_pins(self, color):
+		board = self.board
+		eny_color = color ^ COLOR_MASK
+		king_sq = self.king_sqs[color]
+		checkers = []
+		pins = {}
+		pce = eny_color | KNIGHT
+		for sq in knight_attacks[king_sq]:
+			if board[sq] == pce:
+				checkers.append({sq})
+		pce = eny_color | PAWN
+		for sq in pawn_attackers[eny_color][king_sq]:
+			if board[sq] == pce:
+				checkers.append({sq})
+		queen = eny_color | QUEEN
+		for slider in (ROOK, BISHOP):
+			pce = eny_color | slider
+			for line in rays[slider][king_sq]:
+				blocker = None
+				for n, sq in enumerate(line):
+					if board[sq] == EMPTY:
+						continue
+					if board[sq] & color:
+						if blocker is None:
+							blocker = sq
+							continue
+					elif board[sq] == pce or board[sq] == queen:
+						if blocker is None:
+							checkers.append(set(line[:n+1]))
+						else:
+							pins[blocker] = set(line[:n+1])
 					break
-		return False
+		return checkers, pins
 
-	def has_bishop_move(self,i,j):
-		if self.king == '\u2654':
-			bishop = '\u2657'
-			frly_pcs = ['\u2654','\u2655','\u2656','\u2657','\u2658','\u2659']
+	# pseudo-legal moves of the piece on (i, j): the piece moves the right way
+	# and is not blocked, but the move may still leave its own king in check
+	def piece_moves(self, i, j):
+		board = self.board
+		color = self.color
+		sq = i*8 + j
+		pce = board[sq] & TYPE_MASK
+		if pce == PAWN:
+			yield from self.pawn_moves(i, j)
+		elif pce == KNIGHT or pce == KING:
+			for end in (knight_attacks if pce == KNIGHT else king_attacks)[sq]:
+				if not board[end] & color:
+					yield Move(pce, sq, end)
+			if pce == KING:
+				yield from self.castle_moves()
 		else:
-			bishop = '\u265d'
-			frly_pcs = ['\u265a','\u265b','\u265c','\u265d','\u265e','\u265f']
-		has_legal_move = False
-		last_in_radius = False
-		for di,dj in [(1,1),(-1,1),(-1,-1),(1,-1)]:
-			for d in range(7):
-				i_ = i + di*(d+1)
-				j_ = j + dj*(d+1)
-				if i_ in range(8) and j_ in range(8):
-					old_pce = self.board[i_][j_]
-					if old_pce in frly_pcs:
+			for line in rays[pce][sq]:
+				for end in line:
+					old_pce = board[end]
+					if old_pce & color:
 						break
-					if old_pce != ' ':
-						last_in_radius = True
-					self.board[i_][j_] = bishop
-					self.board[i][j] = ' '
-					if not self.is_check():
-						legal_move = True
-					self.board[i_][j_] = old_pce
-					self.board[i][j] = bishop
-					if has_legal_move:
-						return True
-					if last_in_radius:
+					yield Move(pce, sq, end)
+					if old_pce != EMPTY:
 						break
-				else:
-					break
-		return False
 
-	def has_knight_move(self,i,j):
-		if self.king == '\u2654':
-			knight = '\u2658'
-			frly_pcs = ['\u2654','\u2655','\u2656','\u2657','\u2658','\u2659']
-		else:
-			knight = '\u265e'
-			frly_pcs = ['\u265a','\u265b','\u265c','\u265d','\u265e','\u265f']
-		has_legal_move = False
-		for di,dj in [(2,1),(1,2),(-1,2),(-2,1),(-2,-1),(-1,-2),(1,-2),(2,-1)]:
-			i_ = i + di
-			j_ = j + dj
-			if i_ in range(8) and j_ in range(8):
-				old_pce = self.board[i_][j_]
-				if old_pce in frly_pcs:
-					continue
-				self.board[i_][j_] = knight
-				self.board[i][j] = ' '
-				if not self.is_check():
-					has_legal_move = True
-				self.board[i_][j_] = old_pce
-				self.board[i][j] = knight
-				if has_legal_move:
-					return True
-		return False
-
-	def has_pawn_move(self,i,j):
-		if self.king == '\u2654':
-			pawn = '\u2659'
-			if i == 1:
-				start_sq = True
-			else:
-				start_sq = False
+	def pawn_moves(self, i, j):
+		board = self.board
+		eny_color = self.color ^ COLOR_MASK
+		if self.color == WHITE:
+			srt_r = 1
+			prm_r = 7
 			d_rank = 1
-			eny_pcs = ['\u265b','\u265c','\u265d','\u265e','\u265f']
-			e_p_move = []
-			if abs(self.white_e_p_file - j) == 1 and i == 4:
-				e_p_move.append((1,self.white_e_p_file - j))
+			e_p_file = self.white_e_p_file
 		else:
-			pawn = '\u265f'
-			if i == 6:
-				start_sq = True
-			else:
-				start_sq = False
+			srt_r = 6
+			prm_r = 0
 			d_rank = -1
-			eny_pcs = ['\u2655','\u2656','\u2657','\u2658','\u2659']
-			e_p_move = []
-			if abs(self.black_e_p_file - j) == 1 and i == 3:
-				e_p_move.append((1,self.white_e_p_file - j))
-		has_legal_move = False
-		for di,dj in [(1,-1),(1,1),(1,0)] + [(2,0)] if start_sq else []:
-			i_ = i + di*d_rank
-			j_ = j + dj
-			if i_ in range(8) and j_ in range(8):
-				old_pce = self.board[i_][j_]
-				if dj != 0:
-					if old_pce not in eny_pcs:
-						continue
-				else:
-					if old_pce != ' ':
-						break
-				self.board[i_][j_] = pawn
-				self.board[i][j] = ' '
-				if not self.is_check():
-					has_legal_move = True
-				self.board[i_][j_] = old_pce
-				self.board[i][j] = pawn
-				if has_legal_move:
-					return True
-		for di,dj in e_p_move:
-			self.board[i + di*d_rank][j + dj] = pawn
-			eny_pawn = self.board[i][j + dj]
-			self.board[i][j + dj] = ' '
-			self.board[i][j] = ' '
-			if not self.is_check():
-				has_legal_move = True
-			self.board[i + di*d_rank][j + dj] = ' '
-			self.board[i][j + dj] = eny_pawn
-			self.board[i][j] = pawn
-			if has_legal_move:
-				return True
-		return False
+			e_p_file = self.black_e_p_file
+		sq = i*8 + j
+		i_ = i + d_rank
+		targets = []
+		if board[i_*8 + j] == EMPTY:
+			targets.append(i_*8 + j)
+			if i == srt_r and board[(i_+d_rank)*8 + j] == EMPTY:
+				yield Move(PAWN, sq, (i_+d_rank)*8 + j, EMPTY, DOUBLE_PUSH)
+		for j_ in (j-1, j+1):
+			if 0 <= j_ < 8:
+				if board[i_*8 + j_] & eny_color:
+					targets.append(i_*8 + j_)
+				elif j_ == e_p_file and i == srt_r + 3*d_rank:
+					yield Move(PAWN, sq, i_*8 + j_, EMPTY, EN_PASSANT)
+		for end in targets:
+			if i_ == prm_r:
+				for prm_pce in (QUEEN, ROOK, BISHOP, KNIGHT):
+					yield Move(PAWN, sq, end, prm_pce)
+			else:
+				yield Move(PAWN, sq, end)
+
+	# castling moves whose squares between king and rook are empty; whether the
+	# king passes through check is left to is_safe_move
+	def castle_moves(self):
+		rights = self.white_castle_rights if self.color == WHITE else self.black_castle_rights
+		sq = self.king_sqs[self.color]
+		if rights[0] and self.board[sq+1] == EMPTY and self.board[sq+2] == EMPTY:
+			yield Move(KING, sq, sq+2, EMPTY, CASTLE)
+		if rights[1] and self.board[sq-1] == EMPTY and self.board[sq-2] == EMPTY and self.board[sq-3] == EMPTY:
+			yield Move(KING, sq, sq-2, EMPTY, CASTLE)
+
+	# does a pseudo-legal move leave the mover's king safe
+	def is_safe_move(self, move):
+		color = self.color
+		if move.pce == KING:
+			eny_color = color ^ COLOR_MASK
+			if move.kind == CASTLE:
+				# no castling out of or through check; make_move has usually
+				# just worked out the status, so whether in check is known
+				status = self.cached_status
+				in_check = status.in_check if status is not None else self.is_check()
+				if in_check or self.is_attacked((move.srt + move.end) // 2, eny_color):
+					return False
+			# the king must not shield the squares behind it from a slider
+			return not self.is_attacked(move.end, eny_color, move.srt)
+		if move.kind == EN_PASSANT:
+			return self.is_safe_en_passant(move)
+		checkers, pins = self.checks_and_pins(color)
+		if len(checkers) > 1 or (checkers and move.end not in checkers[0]):
+			return False
+		return move.srt not in pins or move.end in pins[move.srt]
+
+	# Taking en passant removes a pawn that is not on the end square, which
+	# may be the checker, and empties two squares on the capturing pawn's
+	# rank, which may uncover a rook or queen that pin detection does not
+	# see; the board is left untouched.
+	def is_safe_en_passant(self, move):
+		color = self.color
+		board = self.board
+		captured = move.end - 8 if color == WHITE else move.end + 8
+		checkers, pins = self.checks_and_pins(color)
+		if len(checkers) > 1 or (checkers and move.end not in checkers[0] and captured not in checkers[0]):
+			return False
+		if move.srt in pins and move.end not in pins[move.srt]:
+			return False
+		eny_color = color ^ COLOR_MASK
+		for line in rays[ROOK][self.king_sqs[color]]:
+			if move.srt in line:
+				for sq in line:
+					if board[sq] != EMPTY and sq != move.srt and sq != captured:
+						return board[sq] != eny_color | ROOK and board[sq] != eny_color | QUEEN
+		return True
 
 	###############
 
 	def is_threefold_repetition(self):
-		if 3 in self.positions.values():
-			return True
-		return False
+		return self.positions.get(self.key, 0) >= 3
 
-	#todo implement
+	def is_fivefold_repetition(self):
+		return self.positions.get(self.key, 0) >= 5
+
+	# fifty moves by each side without a capture or a pawn move
 	def is_fifty_move_rule(self):
-		return False
+		return self.halfmove_clock >= 100
+
+	def is_seventy_five_move_rule(self):
+		return self.halfmove_clock >= 150
 	
-	#todo implement
+	# Neither side can ever checkmate: only kings, knights and bishops are
+	# left, and either at most one knight or bishop between them or only
+	# bishops that all stand on squares of one colour.
 	def is_dead_position(self):
-		return False
+		counts = self.piece_counts
+		for pce in (PAWN, ROOK, QUEEN):
+			if counts[WHITE | pce] or counts[BLACK | pce]:
+				return False
+		knights = counts[WHITE | KNIGHT] + counts[BLACK | KNIGHT]
+		bishops = counts[WHITE | BISHOP] + counts[BLACK | BISHOP]
+		if knights + bishops <= 1:
+			return True
+		return knights == 0 and 0 in self.bishop_squares
 
 	def print_board(self):
 		for i in range(7, -1, -1):
 			print(i+1, end=" ")
 			for j in range(8):
-				print("'{}'".format(self.board[i][j]), end=' ')
+				print("'{}'".format(glyphs[self.board[i*8 + j]]), end=' ')
 			print('')
 			# print(self.board[i])
 		out = '  '
@@ -874,40 +911,411 @@ class Game:
 		print(out)
 
 
-	def is_legal_move(self, move):
-		if move == "0-0" or move == "0-0-0":
-			return is_legal_castle(move)
-		else:
-			#piece not on starting square
-			#piece cannot move in that direction
-			#there's a piece in the way of your move
-			#that move would put you into check
-			pass
+	# Is move_str (in the input notation) legal in this position? Unlike
+	# make_move this stages nothing, and positions seen before (in any
+	# game) are answered from the cache without generating moves.
+	def is_legal_move(self, move_str):
+		if move_str in ('O-O', 'O-O-O'):
+			move_str = move_str.replace('O', '0')
+		return move_str in self.legal_move_strs()
+
+	# Move generation leaves the board alone, so the lock only guards the
+	# cache itself; two threads missing on the same position both generate
+	# its moves, and the second stores the same set again. If a push or pop
+	# was under way, or happened while the moves were generated, they may
+	# come from a half-made move, so they are not stored (see changes).
+	def legal_move_strs(self):
+		cache = self.legal_move_cache
+		changes = self.changes
+		key = self.key
+		with self.legal_move_cache_lock:
+			move_strs = cache.get(key)
+			if move_strs is not None:
+				cache.move_to_end(key)
+				return move_strs
+		move_strs = frozenset(str(move) for move in self.legal_moves())
+		if changes % 2 or self.changes != changes:
+			return move_strs
+		with self.legal_move_cache_lock:
+			cache[key] = move_strs
+			if len(cache) > self.legal_move_cache_size:
+				cache.popitem(last=False)
+		return move_strs
 
 	def update_king_loc(self):
-		i = 0
-		j = 0
-		for i in range(8):
-			for j in range(8):
-				if self.board[i][j] == self.king:
-					self.king_i = i
-					self.king_j = j
-					return
+		for color in (WHITE, BLACK):
+			self.king_sqs[color] = self.board.index(color | KING)
 
+	# make_move only validates; the move goes on the board here
 	def finish_move(self):
-		# update positions dictionary for 3fold repetition
-		board = str(self.board)
-		if board in self.positions:
-			self.positions[board] += 1
-		else:
-			self.positions[board] = 1
+		self.push(self.pending_move)
+		if self.recorder is not None:
+			self.recorder(self.pending_move)
+		self.pending_move = None
+
+	def switch_turn(self):
+		self.switch_side()
+		self.key ^= zobrist_side ^ self.e_p_key()
+
+	def switch_side(self):
 		if self.turn == 'White':
 			self.turn = 'Black'
-			self.king = '\u265a'
+			self.color = BLACK
 		else:
 			self.turn = 'White'
-			self.king = '\u2654'
-		self.update_king_loc()
+			self.color = WHITE
+
+	##### make/unmake #####
+	#######################
+
+	# play a legal move and hand the turn over, saving what pop needs to
+	# take it back: the captured piece, castle rights, en passant files,
+	# the position key, the halfmove clock, the evaluation terms, the
+	# repetition counts and the cached status (everything else follows
+	# from the move itself)
+	def push(self, move):
+		self.changes += 1
+		cap_sq = move.end
+		if move.kind == EN_PASSANT:
+			cap_sq = move.end - 8 if self.color == WHITE else move.end + 8
+		captured = self.board[cap_sq]
+		self.stack.append((move, captured, self.castle_index(),
+			self.white_e_p_file, self.black_e_p_file, self.key, self.halfmove_clock,
+			self.mg, self.eg, self.phase, self.pawn_key, self.positions, self.cached_status))
+		self.cached_status = None
+		if move.pce == PAWN or captured:
+			self.halfmove_clock = 0
+			self.positions = {}
+		else:
+			self.halfmove_clock += 1
+		if self.color == BLACK:
+			self.fullmove_number += 1
+		self.apply_move(move)
+		self.switch_turn()
+		# update positions dictionary for 3fold repetition
+		self.positions[self.key] = self.positions.get(self.key, 0) + 1
+		self.changes += 1
+
+	# take back the last pushed move and return it
+	def pop(self):
+		self.changes += 1
+		(move, captured, castle_index, self.white_e_p_file, self.black_e_p_file, key, self.halfmove_clock,
+			self.mg, self.eg, self.phase, self.pawn_key, positions, self.cached_status) = self.stack.pop()
+		if positions is self.positions:
+			count = positions[self.key] - 1
+			if count:
+				positions[self.key] = count
+			else:
+				del positions[self.key]
+		else:
+			# the move was irreversible and started a fresh count
+			self.positions = positions
+		self.switch_side()
+		self.key = key
+		if self.color == BLACK:
+			self.fullmove_number -= 1
+		board = self.board
+		pce = board[move.end]
+		if move.prm:
+			self.piece_counts[pce] -= 1
+			if move.prm == BISHOP:
+				self.bishop_squares[square_colors[move.end]] -= 1
+			pce = self.color | PAWN
+			self.piece_counts[pce] += 1
+		if captured:
+			self.piece_counts[captured] += 1
+			if captured & TYPE_MASK == BISHOP:
+				self.bishop_squares[square_colors[move.end]] += 1
+		board[move.end] = EMPTY
+		if move.kind == EN_PASSANT:
+			board[move.end - 8 if self.color == WHITE else move.end + 8] = captured
+		else:
+			board[move.end] = captured
+			if move.kind == CASTLE:
+				if move.end > move.srt:
+					board[move.end + 1] = board[move.end - 1]
+					board[move.end - 1] = EMPTY
+				else:
+					board[move.end - 2] = board[move.end + 1]
+					board[move.end + 1] = EMPTY
+		board[move.srt] = pce
+		if move.pce == KING:
+			self.king_sqs[self.color] = move.srt
+		self.white_castle_rights[0] = bool(castle_index & 1)
+		self.white_castle_rights[1] = bool(castle_index & 2)
+		self.black_castle_rights[0] = bool(castle_index & 4)
+		self.black_castle_rights[1] = bool(castle_index & 8)
+		self.changes += 1
+		return move
+
+	# the move with the given Move.code in this position, which is trusted
+	# to be legal (it came out of an archive or the transposition table)
+	def move_from_code(self, code):
+		srt, end, prm = code & 63, code >> 6 & 63, code >> 12
+		pce = self.board[srt] & TYPE_MASK
+		kind = NORMAL
+		if pce == KING and abs(end - srt) == 2:
+			kind = CASTLE
+		elif pce == PAWN:
+			if abs(end - srt) == 16:
+				kind = DOUBLE_PUSH
+			elif (end - srt) % 8 and self.board[end] == EMPTY:
+				kind = EN_PASSANT
+		return Move(pce, srt, end, prm, kind)
+
+	##### position key #####
+	########################
+
+	def castle_index(self):
+		return (self.white_castle_rights[0] | self.white_castle_rights[1] << 1
+			| self.black_castle_rights[0] << 2 | self.black_castle_rights[1] << 3)
+
+	# the en passant file only counts towards the key when the side to move
+	# has a pawn next to the enemy pawn that could take it
+	def e_p_key(self):
+		if self.color == WHITE:
+			file, i = self.white_e_p_file, 4
+		else:
+			file, i = self.black_e_p_file, 3
+		if file == float('inf'):
+			return 0
+		pawn = self.color | PAWN
+		if (file > 0 and self.board[i*8 + file-1] == pawn) or (file < 7 and self.board[i*8 + file+1] == pawn):
+			return zobrist_e_p[file]
+		return 0
+
+	# full recomputation, only needed when a position is set up from scratch
+	def compute_key(self):
+		key = zobrist_castle[self.castle_index()] ^ self.e_p_key()
+		if self.color == BLACK:
+			key ^= zobrist_side
+		for sq in range(64):
+			key ^= zobrist_pieces[self.board[sq]][sq]
+		return key
+
+	##### evaluation #####
+	########################
+
+	# full recomputation of the terms apply_move keeps up to date, only
+	# needed when a position is set up from scratch
+	def compute_scores(self):
+		self.mg = self.eg = self.phase = self.pawn_key = 0
+		# number of pieces of each code, and of bishops (of either side) on
+		# dark and light squares, for is_dead_position
+		self.piece_counts = [0] * len(glyphs)
+		self.bishop_squares = [0, 0]
+		for sq, pce in enumerate(self.board):
+			self.mg += mg_scores[pce][sq]
+			self.eg += eg_scores[pce][sq]
+			self.phase += phase_weights[pce]
+			self.pawn_key ^= zobrist_pawns[pce][sq]
+			if pce:
+				self.piece_counts[pce] += 1
+				if pce & TYPE_MASK == BISHOP:
+					self.bishop_squares[square_colors[sq]] += 1
+
+	# Static evaluation in centipawns, positive when White is better:
+	# material and piece squares (kept up to date by apply_move) plus
+	# pawn structure and king shelter (cached by pawn_key), blended from
+	# middlegame to endgame weights as pieces come off.
+	def evaluate(self):
+		mg, eg = self.pawn_scores()
+		mg += self.mg
+		eg += self.eg
+		phase = min(self.phase, evaluation.max_phase)
+		# truncated towards zero, so mirroring the colours negates the score exactly
+		return int((mg * phase + eg * (evaluation.max_phase - phase)) / evaluation.max_phase)
+
+	# (mg, eg) pawn structure and king shelter terms from White's point of view
+	def pawn_scores(self):
+		wk, bk = self.king_sqs[WHITE], self.king_sqs[BLACK]
+		cache_key = self.pawn_key ^ zobrist_pieces[WHITE | KING][wk] ^ zobrist_pieces[BLACK | KING][bk]
+		scores = pawn_cache.get(cache_key)
+		if scores is None:
+			if len(pawn_cache) >= PAWN_CACHE_SIZE:
+				pawn_cache.clear()
+			scores = pawn_cache[cache_key] = self.compute_pawn_scores()
+		return scores
+
+	def compute_pawn_scores(self):
+		board = self.board
+		# ranks of each side's pawns, by file
+		ranks = {WHITE: [[] for _ in range(8)], BLACK: [[] for _ in range(8)]}
+		for sq, pce in enumerate(board):
+			if pce & TYPE_MASK == PAWN:
+				ranks[pce & COLOR_MASK][sq % 8].append(sq // 8)
+		mg = eg = 0
+		for color, enemy, side in ((WHITE, BLACK, 1), (BLACK, WHITE, -1)):
+			own, theirs = ranks[color], ranks[enemy]
+			for j in range(8):
+				if not own[j]:
+					continue
+				count = len(own[j])
+				if count > 1:
+					mg += side * evaluation.doubled_pawn[0] * (count - 1)
+					eg += side * evaluation.doubled_pawn[1] * (count - 1)
+				if (j == 0 or not own[j-1]) and (j == 7 or not own[j+1]):
+					mg += side * evaluation.isolated_pawn[0] * count
+					eg += side * evaluation.isolated_pawn[1] * count
+				for i in own[j]:
+					# passed: no enemy pawn ahead on this file or the next ones
+					ahead = range(i+1, 8) if color == WHITE else range(0, i)
+					if not any(r in ahead for f in (j-1, j, j+1) if 0 <= f < 8 for r in theirs[f]):
+						bonus = evaluation.passed_pawn[i-1 if color == WHITE else 6-i]
+						mg += side * bonus[0]
+						eg += side * bonus[1]
+			# a king on its own back two ranks and away from the centre
+			# wants pawns in front of it
+			i, j = divmod(self.king_sqs[color], 8)
+			home = 0 if color == WHITE else 7
+			if abs(i - home) <= 1 and j not in (3, 4):
+				for f in range(max(j-1, 0), min(j+2, 8)):
+					shield = [r for r in own[f] if 0 < (r - i) * side <= 2]
+					if shield:
+						mg += side * evaluation.pawn_shield
+					elif not own[f]:
+						mg += side * evaluation.open_king_file
+		return mg, eg
+
+	##### computer player #####
+	#############################
+
+	# Search for a move for the side to move, to a fixed depth, for
+	# time_limit seconds, or (with neither given) for two seconds.
+	# Returns None if there are no legal moves. The transposition table
+	# is kept on the game so later searches can reuse it.
+	def best_move(self, depth=None, time_limit=None):
+		from engine import Search
+		from transposition import TranspositionTable
+		if depth is None and time_limit is None:
+			time_limit = 2.0
+		if self.table is None:
+			self.table = TranspositionTable()
+		return Search(self, depth, time_limit, table=self.table).run()[0]
+
+	##### perft #####
+	###################
+
+	# number of leaf nodes of the legal move tree depth plies deep
+	def perft(self, depth):
+		if depth == 0:
+			return 1
+		moves = list(self.legal_moves())
+		if depth == 1:
+			return len(moves)
+		nodes = 0
+		for move in moves:
+			self.push(move)
+			nodes += self.perft(depth-1)
+			self.pop()
+		return nodes
+
+	# perft split by root move, for tracking down a miscount
+	def divide(self, depth):
+		counts = {}
+		for move in list(self.legal_moves()):
+			self.push(move)
+			counts[str(move)] = self.perft(depth-1)
+			self.pop()
+		return counts
+
+	##### FEN #####
+	#################
+
+	# Set up a game from a FEN string. The halfmove clock and fullmove
+	# number may be left off; anything else malformed raises ValueError.
+	@classmethod
+	def from_fen(cls, fen):
+		fields = fen.split()
+		if len(fields) == 4:
+			fields += ['0', '1']
+		if len(fields) != 6:
+			raise ValueError("FEN must have 6 fields: {!r}".format(fen))
+		placement, side, castling, e_p_sq, halfmove, fullmove = fields
+		game = cls()
+		game.board[:] = bytes(64)
+		rows = placement.split('/')
+		if len(rows) != 8:
+			raise ValueError("FEN piece placement must have 8 ranks: {!r}".format(placement))
+		for i, row in enumerate(reversed(rows)):
+			j = 0
+			for ch in row:
+				if ch in '12345678':
+					j += int(ch)
+				elif ch.upper() in piece_letters[1:] and j < 8:
+					color = WHITE if ch.isupper() else BLACK
+					game.board[i*8 + j] = color | piece_letters.index(ch.upper())
+					j += 1
+				else:
+					raise ValueError("Bad FEN rank {!r}".format(row))
+			if j != 8:
+				raise ValueError("FEN rank {!r} does not cover 8 files".format(row))
+		if game.board.count(WHITE | KING) != 1 or game.board.count(BLACK | KING) != 1:
+			raise ValueError("FEN must have exactly one king of each colour")
+		if side not in ('w', 'b'):
+			raise ValueError("FEN side to move must be w or b, not {!r}".format(side))
+		if castling != '-' and (not castling or set(castling) - set('KQkq')):
+			raise ValueError("Bad FEN castling rights {!r}".format(castling))
+		if e_p_sq != '-' and not re.match('^[a-h][36]$', e_p_sq):
+			raise ValueError("Bad FEN en passant square {!r}".format(e_p_sq))
+		if any(game.board[sq] & TYPE_MASK == PAWN for sq in itertools.chain(range(8), range(56, 64))):
+			raise ValueError("FEN has a pawn on the first or last rank")
+		if e_p_sq != '-':
+			# the square a pawn of the side not to move just passed over: it
+			# and the square the pawn came from are empty, and the pawn is
+			# on the square beyond
+			step = 8 if side == 'w' else -8
+			e_p = (int(e_p_sq[1]) - 1) * 8 + ord(e_p_sq[0]) - 97
+			pawn = (BLACK if side == 'w' else WHITE) | PAWN
+			if (e_p_sq[1] != ('6' if side == 'w' else '3') or game.board[e_p] or game.board[e_p + step]
+					or game.board[e_p - step] != pawn):
+				raise ValueError("FEN en passant square {} does not follow a double pawn push".format(e_p_sq))
+		if not halfmove.isdigit() or not fullmove.isdigit():
+			raise ValueError("FEN move counters must be numbers")
+		game.turn = 'White' if side == 'w' else 'Black'
+		game.color = WHITE if side == 'w' else BLACK
+		game.update_king_loc()
+		if game.is_check(game.color ^ COLOR_MASK):
+			raise ValueError("FEN has the side not to move in check")
+		game.white_castle_rights = ['K' in castling, 'Q' in castling]
+		game.black_castle_rights = ['k' in castling, 'q' in castling]
+		# rights the pieces on the board could not have are dropped
+		game.update_castle_rights()
+		if e_p_sq != '-':
+			if game.color == WHITE:
+				game.white_e_p_file = ord(e_p_sq[0]) - 97
+			else:
+				game.black_e_p_file = ord(e_p_sq[0]) - 97
+		game.halfmove_clock = int(halfmove)
+		game.fullmove_number = max(int(fullmove), 1)
+		game.key = game.compute_key()
+		game.positions = {game.key:1}
+		game.compute_scores()
+		game.cached_status = None
+		return game
+
+	def to_fen(self):
+		rows = []
+		for i in range(7, -1, -1):
+			row = ''
+			empty = 0
+			for pce in self.board[i*8:i*8 + 8]:
+				if pce == EMPTY:
+					empty += 1
+					continue
+				if empty:
+					row += str(empty)
+					empty = 0
+				letter = piece_letters[pce & TYPE_MASK]
+				row += letter if pce & WHITE else letter.lower()
+			rows.append(row + (str(empty) if empty else ''))
+		castling = ''.join(ch for ch, right in zip('KQkq', self.white_castle_rights + self.black_castle_rights) if right)
+		if self.color == WHITE:
+			e_p_sq = '-' if self.white_e_p_file == float('inf') else 'abcdefgh'[self.white_e_p_file] + '6'
+		else:
+			e_p_sq = '-' if self.black_e_p_file == float('inf') else 'abcdefgh'[self.black_e_p_file] + '3'
+		return "{} {} {} {} {} {}".format('/'.join(rows), 'w' if self.color == WHITE else 'b',
+			castling or '-', e_p_sq, self.halfmove_clock, self.fullmove_number)
 
 	def exit_message(self):
 		winner = ""
@@ -921,16 +1329,364 @@ class Game:
 		print("{}{}! Thanks for playing.".format(winner, phrase))
 
 
-if __name__ == "__main__":
+# reference positions with their published perft counts for depths 1, 2, ...
+perft_positions = {
+	'startpos': ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+		[20, 400, 8902, 197281, 4865609, 119060324]),
+	'kiwipete': ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+		[48, 2039, 97862, 4085603, 193690690]),
+	'position3': ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+		[14, 191, 2812, 43238, 674624, 11030083]),
+	'position4': ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+		[6, 264, 9467, 422333, 15833292]),
+	'position5': ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+		[44, 1486, 62379, 2103487, 89941194]),
+	'position6': ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+		[46, 2079, 89890, 3894594, 164075551]),
+}
+
+def run_perft(args):
+	names = list(perft_positions) if args.position == 'all' else [args.position]
+	report = {'positions': [], 'total_nodes': 0, 'total_seconds': 0.0, 'ok': True}
+	for name in names:
+		# anything that isn't a reference position name is taken to be a FEN
+		fen, expected = perft_positions.get(name, (name, []))
+		game = Game.from_fen(fen)
+		results = []
+		for depth in range(1, args.depth+1):
+			start = time.perf_counter()
+			nodes = game.perft(depth)
+			seconds = time.perf_counter() - start
+			known = expected[depth-1] if depth <= len(expected) else None
+			results.append({
+				'depth': depth,
+				'nodes': nodes,
+				'expected': known,
+				'ok': known is None or nodes == known,
+				'seconds': round(seconds, 6),
+				'nps': int(nodes / seconds) if seconds else None
+			})
+			report['total_nodes'] += nodes
+			report['total_seconds'] += seconds
+			report['ok'] = report['ok'] and results[-1]['ok']
+			if not args.json:
+				print("{:<10} depth {:<2} nodes {:>11} expected {:>11} {:<4} {:>9.3f}s {:>9} nps".format(
+					name if name in perft_positions else 'fen', depth, nodes,
+					'?' if known is None else known, 'ok' if results[-1]['ok'] else 'FAIL',
+					seconds, results[-1]['nps'] or '-'))
+		report['positions'].append({'name': name, 'fen': fen, 'depths': results})
+		if args.divide and args.depth > 0:
+			divided = dict(sorted(game.divide(args.depth).items()))
+			if args.json:
+				report['positions'][-1]['divide'] = divided
+			else:
+				for move_str, nodes in divided.items():
+					print("{} {}".format(move_str, nodes))
+	seconds = report['total_seconds']
+	report['total_seconds'] = round(seconds, 6)
+	report['nps'] = int(report['total_nodes'] / seconds) if seconds else None
+	if args.json:
+		print(json.dumps(report, indent=2))
+	else:
+		print("total nodes {} in {:.3f}s ({} nps){}".format(report['total_nodes'], seconds,
+			report['nps'] or '-', '' if report['ok'] else ' -- MISMATCH'))
+	return 0 if report['ok'] else 1
+
+# Play one game given as a list of move strings with no terminal I/O.
+# Returns (result, plies, illegal) where result is the game result or '*'
+# if the moves stop before the game is over, and illegal is None or a
+# (move_str, message) pair for the first move that was rejected. The
+# moves are played on game if one is given, otherwise on a new one.
+def replay_game(move_strs, game=None):
+	if game is None:
+		game = Game()
+	for move_str in move_strs:
+		if game.is_over():
+			return game.result, len(game.stack), (move_str, "The game is already over.")
+		if not game.is_well_formed(move_str):
+			return '*', len(game.stack), (move_str, format_message)
+		msg = game.make_move(move_str)
+		if msg:
+			return '*', len(game.stack), (move_str, msg)
+		game.finish_move()
+	game.is_over()
+	return game.result or '*', len(game.stack), None
+
+def format_replay(game_no, replayed):
+	result, plies, illegal = replayed
+	if illegal is None:
+		return "{}\t{}\t{}\t-".format(game_no, result, plies)
+	return "{}\t{}\t{}\t{}\t{}".format(game_no, result, plies, *illegal)
 
-	game = Game()
+# the games in a move list file: one game per line, moves separated by
+# whitespace; blank lines and lines starting with '#' are skipped
+def read_games(path):
+	lines = sys.stdin if path == '-' else open(path)
+	try:
+		for game_no, line in enumerate(lines, 1):
+			line = line.strip()
+			if line and not line.startswith('#'):
+				yield game_no, line.split()
+	finally:
+		if lines is not sys.stdin:
+			lines.close()
+
+def run_replay(args):
+	if args.instrument:
+		import instrumentation
+		instrumentation.enable(Game)
+	start = time.perf_counter()
+	games = 0
+	illegal = 0
+	out = sys.stdout
+	for game_no, move_strs in read_games(args.file):
+		replayed = replay_game(move_strs)
+		out.write(format_replay(game_no, replayed) + '\n')
+		games += 1
+		illegal += replayed[2] is not None
+	seconds = time.perf_counter() - start
+	print("{} games ({} with an illegal move) in {:.3f}s, {:.1f} games/s".format(
+		games, illegal, seconds, games / seconds if seconds else 0), file=sys.stderr)
+	if args.instrument:
+		report = instrumentation.to_json() + '\n' if args.instrument == 'json' else instrumentation.to_prometheus()
+		sys.stderr.write(report)
+	return 0
+
+# worker side of validate: replay a chunk of (game_no, move_strs) pairs
+def replay_chunk(chunk):
+	return [format_replay(game_no, replay_game(move_strs)) for game_no, move_strs in chunk]
+
+def run_validate(args):
+	jobs = args.jobs or os.cpu_count()
+	start = time.perf_counter()
+	games = 0
+	out = sys.stdout
+	game_iter = read_games(args.file)
+	chunks = iter(lambda: list(itertools.islice(game_iter, args.chunk)), [])
+	if jobs == 1:
+		for chunk in chunks:
+			for line in replay_chunk(chunk):
+				out.write(line + '\n')
+			games += len(chunk)
+	else:
+		# Pool.imap pulls its whole input up front, so at most a few chunks
+		# per worker are kept in flight, and their results written in input
+		# order. Nothing blocks outside this loop, so an exception here
+		# (Ctrl-C, a closed pipe, a failed worker) lets the pool shut down.
+		in_flight = deque()
+		def write_oldest():
+			lines = in_flight.popleft().get()
+			for line in lines:
+				out.write(line + '\n')
+			return len(lines)
+		with multiprocessing.Pool(jobs) as pool:
+			for chunk in chunks:
+				if len(in_flight) == jobs * 4:
+					games += write_oldest()
+				in_flight.append(pool.apply_async(replay_chunk, (chunk,)))
+			while in_flight:
+				games += write_oldest()
+	seconds = time.perf_counter() - start
+	print("{} games with {} jobs in {:.3f}s, {:.1f} games/s".format(
+		games, jobs, seconds, games / seconds if seconds else 0), file=sys.stderr)
+	return 0
+
+def run_pack(args):
+	from archive import ArchiveWriter
+	start = time.perf_counter()
+	skipped = 0
+	with ArchiveWriter(args.archive) as writer:
+		for game_no, move_strs in read_games(args.file):
+			game = Game()
+			writer.record(game)
+			replayed = replay_game(move_strs, game)
+			if replayed[2] is None:
+				writer.finish(game)
+			else:
+				writer.discard(game)
+				print("skipped " + format_replay(game_no, replayed), file=sys.stderr)
+				skipped += 1
+		games = len(writer)
+	seconds = time.perf_counter() - start
+	print("{} games packed ({} skipped) in {:.3f}s, {:.1f} games/s".format(
+		games, skipped, seconds, games / seconds if seconds else 0), file=sys.stderr)
+	return 0
+
+def run_unpack(args):
+	from archive import ArchiveReader, replay
+	out = sys.stdout
+	with ArchiveReader(args.archive) as reader:
+		for archived in reader:
+			out.write(' '.join(str(move) for move, game in replay(archived.moves) if move) + '\n')
+	return 0
+
+def run_index(args):
+	from position_index import build_index
+	start = time.perf_counter()
+	count = build_index(args.archive, args.index, args.run_records)
+	print("{} positions indexed in {:.3f}s".format(count, time.perf_counter() - start), file=sys.stderr)
+	return 0
+
+def run_search(args):
+	from position_index import PositionIndex, position_key
+	key = position_key(args.fen, args.moves)
+	start = time.perf_counter()
+	with PositionIndex(args.index) as index:
+		found = index.lookup(key)
+	seconds = time.perf_counter() - start
+	for game_id, ply in found[:args.limit] if args.limit else found:
+		print("{}\t{}".format(game_id, ply))
+	print("{} occurrences in {} games, {:.3f}ms".format(len(found), len(set(game_id for game_id, ply in found)),
+		seconds * 1000), file=sys.stderr)
+	return 0
+
+def run_book(args):
+	from book import build_book
+	start = time.perf_counter()
+	count = build_book(args.archive, args.book, args.plies, args.run_entries)
+	print("{} book moves in {:.3f}s".format(count, time.perf_counter() - start), file=sys.stderr)
+	return 0
+
+def run_analyze(args):
+	from engine import analyze
+	game = Game() if args.fen is None else Game.from_fen(args.fen)
+	threads = args.threads or os.cpu_count()
+	time_limit = args.time
+	if args.depth is None and time_limit is None:
+		time_limit = 10.0
+	def report(depth, score, nodes, seconds, pv):
+		print("depth {} score {} nodes {} nps {} time {:.3f} pv {}".format(
+			depth, score, nodes, int(nodes / seconds) if seconds else '-', seconds, ' '.join(map(str, pv))))
+		sys.stdout.flush()
+	move, score, depth = analyze(game, threads, args.depth, time_limit, args.hash, report)
+	if move is None:
+		print("no legal moves")
+	else:
+		print("best move {} score {} depth {} ({} threads)".format(move, score, depth, threads))
+	return 0
+
+def run_serve(args):
+	import asyncio
+	from server import serve
+	if args.instrument:
+		import instrumentation
+		instrumentation.enable()
+	try:
+		asyncio.run(serve(args.host, args.port, args.reuse_port))
+	except KeyboardInterrupt:
+		pass
+	return 0
+
+def play(fen=None, computer=None, think=2.0, book=None):
+	game = Game() if fen is None else Game.from_fen(fen)
+	if book is not None:
+		from book import OpeningBook
+		game.book = OpeningBook(book)
 	game.welcome_message()
 
 	# breakpoint()
 	while not game.is_over():
-		game.get_move()
+		if game.turn == computer:
+			move = game.best_move(time_limit=think)
+			print("{} plays {}".format(computer, move))
+			game.make_move(str(move))
+			game.finish_move()
+		else:
+			game.get_move()
 
 	game.exit_message()
 
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Text chess. Run without a command to start a two player game.")
+	parser.add_argument('--fen', help="start the game from this position")
+	parser.add_argument('--vs-computer', action='store_true', help="play against the computer instead of a second player")
+	parser.add_argument('--computer-plays', choices=['White', 'Black'], default='Black', help="the computer's side (default Black)")
+	parser.add_argument('--think', type=float, default=2.0, help="seconds the computer spends on each move")
+	parser.add_argument('--book', help="opening book file for the 'hint' command")
+	parser.add_argument('--uci', action='store_true', help="talk to a chess GUI over the UCI protocol on stdin/stdout")
+	commands = parser.add_subparsers(dest='command')
+	perft_parser = commands.add_parser('perft', help="count move tree leaf nodes and check them against reference counts")
+	perft_parser.add_argument('depth', type=int)
+	perft_parser.add_argument('--position', default='startpos',
+		help="one of {}, 'all', or a FEN string".format(', '.join(perft_positions)))
+	perft_parser.add_argument('--divide', action='store_true', help="also print the node count under each root move")
+	perft_parser.add_argument('--json', action='store_true', help="print the report as JSON")
+	replay_parser = commands.add_parser('replay', help="validate games from a move list file without the interactive board")
+	replay_parser.add_argument('file', help="one game per line, moves separated by spaces, or - for stdin")
+	replay_parser.add_argument('--instrument', choices=['json', 'prometheus'],
+		help="count calls and time in the Game hot paths and print them to stderr in this format")
+	validate_parser = commands.add_parser('validate', help="replay a move list file across several processes")
+	validate_parser.add_argument('file', help="one game per line, moves separated by spaces, or - for stdin")
+	validate_parser.add_argument('--jobs', type=int, default=0, help="worker processes (default: one per core)")
+	validate_parser.add_argument('--chunk', type=int, default=64, help="games sent to a worker at a time")
+	pack_parser = commands.add_parser('pack', help="write the legal games of a move list file to a binary archive")
+	pack_parser.add_argument('file', help="one game per line, moves separated by spaces, or - for stdin")
+	pack_parser.add_argument('archive', help="archive file to write")
+	unpack_parser = commands.add_parser('unpack', help="print the games in a binary archive as move lists")
+	unpack_parser.add_argument('archive')
+	index_parser = commands.add_parser('index', help="build a position index over a binary archive")
+	index_parser.add_argument('archive')
+	index_parser.add_argument('index', help="index file to write")
+	index_parser.add_argument('--run-records', type=int, default=1 << 20, help="positions sorted in memory at a time")
+	search_parser = commands.add_parser('search', help="list the archived games that reached a position")
+	search_parser.add_argument('index')
+	search_parser.add_argument('moves', nargs='*', help="moves from the starting position (or from --fen)")
+	search_parser.add_argument('--fen', help="position to search for, or to play the moves from")
+	search_parser.add_argument('--limit', type=int, default=0, help="print at most this many games")
+	book_parser = commands.add_parser('book', help="build an opening book from a binary archive")
+	book_parser.add_argument('archive')
+	book_parser.add_argument('book', help="book file to write")
+	book_parser.add_argument('--plies', type=int, default=30, help="plies of each game that go into the book")
+	book_parser.add_argument('--run-entries', type=int, default=1 << 20, help="positions counted in memory at a time")
+	analyze_parser = commands.add_parser('analyze', help="search a position with several processes and print the best line")
+	analyze_parser.add_argument('--fen', help="position to analyze (default: the starting position)")
+	analyze_parser.add_argument('--threads', type=int, default=0, help="worker processes (default: one per core)")
+	analyze_parser.add_argument('--depth', type=int, help="stop after this many plies")
+	analyze_parser.add_argument('--time', type=float, help="stop after this many seconds (default 10 when no depth is given)")
+	analyze_parser.add_argument('--hash', type=int, default=64, help="shared transposition table size in MB")
+	serve_parser = commands.add_parser('serve', help="host games for network clients over a line-based TCP protocol")
+	serve_parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default 127.0.0.1)")
+	serve_parser.add_argument('--port', type=int, default=8765, help="port to listen on (default 8765)")
+	serve_parser.add_argument('--reuse-port', action='store_true', help="let several server processes share the port")
+	serve_parser.add_argument('--instrument', action='store_true', help="add Game method call counts and times to metrics")
+	# the benchmark options belong to benchmarks.main, which also runs as python -m benchmarks
+	commands.add_parser('bench', add_help=False, help="time the Game hot paths; bench -h lists the options")
+	args, rest = parser.parse_known_args(argv)
+	if args.command == 'bench':
+		from benchmarks import main as run_bench
+		return run_bench(rest)
+	if rest:
+		parser.error("unrecognized arguments: {}".format(' '.join(rest)))
+	if args.uci:
+		from uci import run_uci
+		return run_uci()
+	if args.command == 'replay':
+		return run_replay(args)
+	elif args.command == 'validate':
+		return run_validate(args)
+	elif args.command == 'serve':
+		return run_serve(args)
+	elif args.command == 'pack':
+		return run_pack(args)
+	elif args.command == 'unpack':
+		return run_unpack(args)
+	elif args.command == 'index':
+		return run_index(args)
+	elif args.command == 'book':
+		return run_book(args)
+	# the commands that take a FEN, which from_fen rejects with a ValueError
+	try:
+		if args.command == 'perft':
+			return run_perft(args)
+		if args.command == 'analyze':
+			return run_analyze(args)
+		if args.command == 'search':
+			return run_search(args)
+		play(args.fen, args.computer_plays if args.vs_computer else None, args.think, args.book)
+	except ValueError as e:
+		parser.error(str(e))
+	return 0
 
 
+if __name__ == "__main__":
+	sys.exit(main())
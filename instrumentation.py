@@ -0,0 +1,88 @@
+# Opt-in call counts and wall time for the Game methods that latency
+# goes into: check detection, the legal move search, making and finishing
+# moves and printing the board. enable() swaps timing wrappers onto the
+# Game class and disable() puts the plain methods back, so when it is off
+# nothing is added to any call.
+#
+# Times are inclusive: is_check's time includes the is_attacked call it
+# makes, and status (behind is_over, is_checkmate and is_stalemate)
+# includes checks_and_pins. Methods that call each other are each counted.
+#
+# When game.py is run as a script its Game class is __main__.Game, not
+# game.Game, so it passes its own class to enable.
+
+import functools
+import json
+import time
+
+from game import Game
+
+methods = [
+	'is_check', 'is_attacked', 'checks_and_pins', 'status', 'has_move', 'is_over',
+	'make_move', 'make_castle_move', 'make_king_move', 'make_queen_move', 'make_rook_move',
+	'make_bishop_move', 'make_knight_move', 'make_pawn_move',
+	'finish_move', 'print_board'
+]
+
+# method name -> [calls, seconds]
+counters = {name: [0, 0.0] for name in methods}
+# method name -> the plain method, while enabled
+originals = {}
+instrumented = None
+
+def timed(method, counter):
+	@functools.wraps(method)
+	def wrapper(*args, **kwargs):
+		start = time.perf_counter()
+		try:
+			return method(*args, **kwargs)
+		finally:
+			counter[1] += time.perf_counter() - start
+			counter[0] += 1
+	return wrapper
+
+def enabled():
+	return bool(originals)
+
+def enable(game_class=Game):
+	global instrumented
+	if originals:
+		return
+	instrumented = game_class
+	for name in methods:
+		originals[name] = game_class.__dict__[name]
+		setattr(game_class, name, timed(originals[name], counters[name]))
+
+def disable():
+	global instrumented
+	for name, method in originals.items():
+		setattr(instrumented, name, method)
+	originals.clear()
+	instrumented = None
+
+def reset():
+	for counter in counters.values():
+		counter[0] = 0
+		counter[1] = 0.0
+
+# {method: {'calls': n, 'seconds': s}} for the methods called since the last reset
+def snapshot():
+	return {name: {'calls': calls, 'seconds': round(seconds, 6)}
+		for name, (calls, seconds) in counters.items() if calls}
+
+def to_json():
+	return json.dumps(snapshot())
+
+# the counters in the Prometheus text exposition format
+def to_prometheus():
+	lines = [
+		"# HELP textchess_game_calls_total Calls of each instrumented Game method.",
+		"# TYPE textchess_game_calls_total counter"
+	]
+	lines += ['textchess_game_calls_total{{method="{}"}} {}'.format(name, calls) for name, (calls, seconds) in counters.items()]
+	lines += [
+		"# HELP textchess_game_seconds_total Wall time spent in each instrumented Game method.",
+		"# TYPE textchess_game_seconds_total counter"
+	]
+	lines += ['textchess_game_seconds_total{{method="{}"}} {:.6f}'.format(name, seconds) for name, (calls, seconds) in counters.items()]
+	return '\n'.join(lines) + '\n'
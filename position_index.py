@@ -0,0 +1,64 @@
+# Position index over a game archive: which games reached a position,
+# and at which ply. Positions are identified by Game.key.
+#
+# The index file is the magic b'TCP1' followed by 16-byte records sorted
+# by position: key (8 bytes), game id (4), ply (4), all big-endian. It is
+# a sorted record file (see record_file), so archives far bigger than
+# memory can be indexed and a lookup only reads a few pages.
+
+import struct
+
+from archive import ArchiveReader, replay
+from game import Game, format_message
+from record_file import SortedRecordFile, SortedRecordWriter
+
+MAGIC = b'TCP1'
+RECORD_BYTES = 16
+record = struct.Struct('>QII')
+
+# records sorted in memory before a run is written out
+RUN_RECORDS = 1 << 20
+
+# one int per record, laid out like the record itself, sorts fastest
+def packed(records):
+	records.sort()
+	return (n.to_bytes(RECORD_BYTES, 'big') for n in records)
+
+# Index every position of every game in archive_path (including the
+# starting position, at ply 0) into index_path. Returns the number of
+# records written.
+def build_index(archive_path, index_path, run_records=RUN_RECORDS):
+	records = []
+	with SortedRecordWriter(index_path, MAGIC, record) as writer:
+		with ArchiveReader(archive_path) as reader:
+			for game_id, archived in enumerate(reader):
+				for ply, (move, game) in enumerate(replay(archived.moves)):
+					records.append(game.key << 64 | game_id << 32 | ply)
+				if len(records) >= run_records:
+					writer.add_run(packed(records))
+					records = []
+		return writer.write(writer.merged(packed(records)))
+
+class PositionIndex(SortedRecordFile):
+
+	description = 'a position index'
+
+	def __init__(self, path):
+		super().__init__(path, MAGIC, record)
+
+	# (game id, ply) for every time the position with this key was reached,
+	# by game id
+	def lookup(self, key):
+		return [tuple(fields) for fields in self.find(key)]
+
+# Game.key of the position given by a FEN (the starting position by
+# default) followed by moves in the input notation. Raises ValueError
+# for a bad FEN or an illegal move.
+def position_key(fen=None, move_strs=()):
+	game = Game() if fen is None else Game.from_fen(fen)
+	for move_str in move_strs:
+		msg = format_message if not game.is_well_formed(move_str) else game.make_move(move_str)
+		if msg:
+			raise ValueError("{}: {}".format(move_str, msg))
+		game.finish_move()
+	return game.key
@@ -0,0 +1,119 @@
+# Files of fixed-size records sorted by their bytes, as used by the
+# position index and the opening book: a magic string followed by the
+# records, each packed with a big-endian struct whose first field is the
+# lookup key, so records compare the same as bytes and as numbers.
+#
+# SortedRecordWriter builds one with an external sort (sorted runs
+# written to temporary files, then merged) so inputs far bigger than
+# memory can be sorted, and SortedRecordFile memory-maps one and finds a
+# key by binary search, reading a few pages however big the file is.
+
+import heapq
+import mmap
+import os
+import tempfile
+
+# records written or read at a time
+BLOCK_RECORDS = 4096
+
+class SortedRecordWriter:
+
+	def __init__(self, path, magic, record):
+		self.path = path
+		self.magic = magic
+		self.record = record
+		self.runs = []
+		self.tmp_dir = tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path)))
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.tmp_dir.cleanup()
+
+	# write records (packed, already sorted) to a temporary run
+	def add_run(self, records):
+		self.runs.append(os.path.join(self.tmp_dir.name, 'run{}'.format(len(self.runs))))
+		with open(self.runs[-1], 'wb') as f:
+			f.write(b''.join(records))
+
+	def read_run(self, path):
+		size = self.record.size
+		with open(path, 'rb') as f:
+			while True:
+				block = f.read(size * BLOCK_RECORDS)
+				if not block:
+					break
+				for i in range(0, len(block), size):
+					yield block[i:i + size]
+
+	# the records of every run and of last (packed records still in memory,
+	# sorted), merged into one sorted stream
+	def merged(self, last=()):
+		return heapq.merge(*(self.read_run(path) for path in self.runs), last)
+
+	# write the file: the magic, then records (packed, sorted). Returns the
+	# number of records written.
+	def write(self, records):
+		records = iter(records)
+		written = 0
+		with open(self.path, 'wb') as out:
+			out.write(self.magic)
+			while True:
+				block = b''.join(next(records, b'') for _ in range(BLOCK_RECORDS))
+				if not block:
+					break
+				out.write(block)
+				written += len(block) // self.record.size
+		return written
+
+class SortedRecordFile:
+
+	# what the file holds, for the error when it is not one
+	description = 'a sorted record file'
+
+	def __init__(self, path, magic, record):
+		self.magic = magic
+		self.record = record
+		with open(path, 'rb') as f:
+			self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		if self.map[:len(magic)] != magic or (len(self.map) - len(magic)) % record.size:
+			self.map.close()
+			raise ValueError("{} is not {}".format(path, self.description))
+		self.count = (len(self.map) - len(magic)) // record.size
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def __len__(self):
+		return self.count
+
+	def unpack(self, i):
+		return self.record.unpack_from(self.map, len(self.magic) + i * self.record.size)
+
+	# index of the first record whose key is at least key
+	def lower_bound(self, key):
+		lo, hi = 0, self.count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self.unpack(mid)[0] < key:
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo
+
+	# the fields after the key of every record with this key, in file order
+	def find(self, key):
+		found = []
+		for i in range(self.lower_bound(key), self.count):
+			found_key, *fields = self.unpack(i)
+			if found_key != key:
+				break
+			found.append(fields)
+		return found
+
+	def close(self):
+		self.map.close()
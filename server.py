@@ -0,0 +1,152 @@
+# Line-based game server (python game.py serve): many games hosted in one
+# asyncio event loop. Every request is one line and gets one line back,
+# starting with "ok" or "error":
+#
+#   new                 ok <id> White
+#   move <id> Pe2e4     ok <id> <side to move, or the result once the game is over>
+#   board <id>          ok <id> <FEN>
+#   resign <id>         ok <id> <result>    (the side to move resigns)
+#   metrics             ok <JSON: games, moves and move latency in microseconds,
+#                       and with serve --instrument calls and seconds per Game method>
+#   quit                closes the connection
+#
+# Illegal moves are answered with make_move's own messages. Games are
+# dropped once they are over, or when the connection that started them
+# closes, so clients that go away do not leave games behind.
+
+import asyncio
+import collections
+import json
+import time
+
+import instrumentation
+from game import Game, format_message
+
+# latencies kept for the percentiles in metrics
+LATENCY_WINDOW = 10000
+
+class GameServer:
+
+	def __init__(self):
+		self.games = {}
+		self.next_id = 1
+		self.started = 0
+		self.finished = 0
+		self.abandoned = 0
+		self.moves = 0
+		self.rejected = 0
+		self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+	async def handle(self, reader, writer):
+		# ids of the games this connection started
+		started = set()
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				words = line.decode(errors='replace').split()
+				if words == ['quit']:
+					break
+				writer.write((self.command(words, started) + '\n').encode())
+				await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			for game_id in started:
+				if self.games.pop(game_id, None) is not None:
+					self.abandoned += 1
+			writer.close()
+			try:
+				await writer.wait_closed()
+			except ConnectionError:
+				pass
+
+	# started, if given, collects the ids of new games
+	def command(self, words, started=None):
+		if not words:
+			return "error Empty command."
+		name, args = words[0], words[1:]
+		if name == 'new' and not args:
+			return self.new_game(started)
+		if name == 'metrics' and not args:
+			return "ok " + json.dumps(self.metrics())
+		if name in ('move', 'board', 'resign') and len(args) == (2 if name == 'move' else 1):
+			game = self.games.get(args[0])
+			if game is None:
+				return "error No game {}.".format(args[0])
+			if name == 'move':
+				return self.move(args[0], game, args[1])
+			elif name == 'board':
+				return "ok {} {}".format(args[0], game.to_fen())
+			else:
+				game.result = '0-1' if game.turn == 'White' else '1-0'
+				return self.end_game(args[0], game)
+		return "error Unknown command {!r}.".format(' '.join(words))
+
+	def new_game(self, started=None):
+		game_id = str(self.next_id)
+		self.next_id += 1
+		self.games[game_id] = Game()
+		self.started += 1
+		if started is not None:
+			# forget the ones that are already over
+			started.intersection_update(self.games)
+			started.add(game_id)
+		return "ok {} White".format(game_id)
+
+	def move(self, game_id, game, move_str):
+		start = time.perf_counter()
+		if not game.is_well_formed(move_str):
+			msg = format_message
+		else:
+			msg = game.make_move(move_str)
+		if msg:
+			self.rejected += 1
+			return "error " + msg
+		game.finish_move()
+		over = game.is_over()
+		self.latencies.append(time.perf_counter() - start)
+		self.moves += 1
+		if over:
+			return self.end_game(game_id, game)
+		return "ok {} {}".format(game_id, game.turn)
+
+	def end_game(self, game_id, game):
+		del self.games[game_id]
+		self.finished += 1
+		return "ok {} {}".format(game_id, game.result)
+
+	def metrics(self):
+		latencies = sorted(self.latencies)
+		def percentile(p):
+			return round(latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1e6, 1) if latencies else None
+		metrics = {
+			'games': len(self.games),
+			'games_started': self.started,
+			'games_finished': self.finished,
+			'games_abandoned': self.abandoned,
+			'moves': self.moves,
+			'moves_rejected': self.rejected,
+			'move_latency_us': {
+				'window': len(latencies),
+				'mean': round(sum(latencies) / len(latencies) * 1e6, 1) if latencies else None,
+				'p50': percentile(0.5),
+				'p90': percentile(0.9),
+				'p99': percentile(0.99),
+				'max': percentile(1.0)
+			}
+		}
+		if instrumentation.enabled():
+			metrics['game_calls'] = instrumentation.snapshot()
+		return metrics
+
+# Serve until interrupted. With reuse_port several server processes (one
+# per core, say) can listen on the same port and the kernel spreads the
+# connections between them; each process has its own games.
+async def serve(host, port, reuse_port=False):
+	game_server = GameServer()
+	server = await asyncio.start_server(game_server.handle, host, port, reuse_port=reuse_port or None)
+	print("serving on {}".format(', '.join('{}:{}'.format(*sock.getsockname()[:2]) for sock in server.sockets)))
+	async with server:
+		await server.serve_forever()
@@ -0,0 +1,188 @@
+import os
+import tempfile
+import unittest
+
+from archive import ArchiveReader, ArchiveWriter, replay
+from game import Game, perft_positions
+
+class FenTest(unittest.TestCase):
+
+	def test_reference_positions_load(self):
+		for fen, counts in perft_positions.values():
+			self.assertEqual(Game.from_fen(fen).to_fen(), fen)
+
+	def test_pawn_on_back_rank(self):
+		for fen in ("4k2P/8/8/8/8/8/8/4K3 w - - 0 1", "4k3/8/8/8/8/8/8/p3K3 w - - 0 1"):
+			with self.assertRaises(ValueError):
+				Game.from_fen(fen)
+
+	def test_en_passant_square(self):
+		# a legal double push behind it, for each side to move
+		Game.from_fen("4k3/8/8/3Pp3/8/8/8/4K3 w - e6 0 1")
+		Game.from_fen("4k3/8/8/8/3pP3/8/8/4K3 b - e3 0 1")
+		for fen in (
+			"4k3/8/8/3Pp3/8/8/8/4K3 w - e3 0 1",  # wrong rank for the side to move
+			"4k3/8/8/3Pn3/8/8/8/4K3 w - e6 0 1",  # no pawn beyond it
+			"4k3/8/8/3P4/8/8/8/4K3 w - e6 0 1",   # nothing beyond it
+			"4k3/4p3/8/3Pp3/8/8/8/4K3 w - e6 0 1", # the pawn's start square is occupied
+			"4k3/8/4n3/3Pp3/8/8/8/4K3 w - e6 0 1", # the square itself is occupied
+		):
+			with self.assertRaises(ValueError):
+				Game.from_fen(fen)
+
+	def test_side_not_to_move_in_check(self):
+		with self.assertRaises(ValueError):
+			Game.from_fen("4k3/4Q3/8/8/8/8/8/4K3 w - - 0 1")
+		Game.from_fen("4k3/4Q3/8/8/8/8/8/4K3 b - - 0 1")
+
+class EnPassantTest(unittest.TestCase):
+
+	def legal(self, fen):
+		return {str(move) for move in Game.from_fen(fen).legal_moves()}
+
+	def test_rank_pin(self):
+		# both pawns leave the fifth rank, uncovering the rook on the king
+		self.assertNotIn('Pb5c6', self.legal("8/8/8/KPp4r/8/8/8/4k3 w - c6 0 1"))
+
+	def test_capturing_the_checker(self):
+		self.assertIn('Pd5e6', self.legal("8/8/8/3Pp3/5K2/8/8/4k3 w - e6 0 1"))
+
+	def test_board_untouched(self):
+		game = Game.from_fen("8/8/8/KPp4r/8/8/8/4k3 w - c6 0 1")
+		fen = game.to_fen()
+		game.is_legal_move('Ka5a6')
+		game.is_legal_move('Pb5c6')
+		self.assertEqual(game.to_fen(), fen)
+
+# the same position with the board turned round and the colours swapped
+def mirror(fen):
+	placement, side, castling, e_p_sq, halfmove, fullmove = fen.split()
+	placement = '/'.join(reversed(placement.split('/'))).swapcase()
+	castling = ''.join(sorted(castling.swapcase(), key='KQkq-'.index))
+	if e_p_sq != '-':
+		e_p_sq = e_p_sq[0] + ('6' if e_p_sq[1] == '3' else '3')
+	return ' '.join([placement, 'b' if side == 'w' else 'w', castling, e_p_sq, halfmove, fullmove])
+
+class EvaluateTest(unittest.TestCase):
+
+	def test_colour_symmetry(self):
+		for fen, counts in perft_positions.values():
+			game = Game.from_fen(fen)
+			for move in list(game.legal_moves()):
+				game.push(move)
+				self.assertEqual(game.evaluate(), -Game.from_fen(mirror(game.to_fen())).evaluate())
+				game.pop()
+
+class DeadPositionTest(unittest.TestCase):
+
+	def dead(self, fen):
+		return Game.from_fen(fen).is_dead_position()
+
+	def test_dead(self):
+		self.assertTrue(self.dead("4k3/8/8/8/8/8/8/4K3 w - - 0 1"))
+		self.assertTrue(self.dead("4k3/8/8/8/8/8/8/2B1K3 w - - 0 1"))
+		self.assertTrue(self.dead("4k3/8/8/8/8/8/8/1N2K3 b - - 0 1"))
+		# bishops on c1 and f8 are both on dark squares
+		self.assertTrue(self.dead("4kb2/8/8/8/8/8/8/2B1K3 w - - 0 1"))
+
+	def test_not_dead(self):
+		# c1 is dark and c8 light, so a mate is possible
+		self.assertFalse(self.dead("2b1k3/8/8/8/8/8/8/2B1K3 w - - 0 1"))
+		self.assertFalse(self.dead("1n2k3/8/8/8/8/8/8/1N2K3 w - - 0 1"))
+		self.assertFalse(self.dead("4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"))
+
+	def test_ends_the_game(self):
+		game = Game.from_fen("4k3/8/8/8/8/8/8/4K3 w - - 0 1")
+		self.assertTrue(game.is_over())
+		self.assertEqual(game.result, '1/2-1/2')
+		# reached by a capture, from the counts kept as moves are played
+		game = Game.from_fen("4k3/8/8/8/8/8/3r4/2B1K3 w - - 0 1")
+		self.assertFalse(game.is_over())
+		self.assertFalse(game.make_move('Ke1d2'))
+		game.finish_move()
+		self.assertTrue(game.is_over())
+		self.assertEqual(game.result, '1/2-1/2')
+
+class DrawRuleTest(unittest.TestCase):
+
+	# a rook each, so the position is not dead
+	fen = "r3k3/8/8/8/8/8/8/R3K3 w - - {} 80"
+
+	def status(self, halfmove, claim_draws):
+		game = Game.from_fen(self.fen.format(halfmove))
+		game.claim_draws = claim_draws
+		return game.status().result
+
+	def test_fifty_move_rule(self):
+		self.assertIsNone(self.status(99, True))
+		self.assertEqual(self.status(100, True), '1/2-1/2')
+		self.assertIsNone(self.status(100, False))
+
+	def test_seventy_five_move_rule(self):
+		self.assertIsNone(self.status(149, False))
+		self.assertEqual(self.status(150, False), '1/2-1/2')
+		game = Game.from_fen(self.fen.format(149))
+		game.claim_draws = False
+		self.assertFalse(game.make_move('Ke1d1'))
+		game.finish_move()
+		self.assertTrue(game.is_over())
+		self.assertEqual(game.result, '1/2-1/2')
+
+	def play(self, game, move_strs):
+		for move_str in move_strs.split():
+			self.assertFalse(game.make_move(move_str))
+			game.finish_move()
+
+	def test_threefold_repetition(self):
+		for claim_draws in (True, False):
+			game = Game()
+			game.claim_draws = claim_draws
+			self.play(game, "Ng1f3 Ng8f6 Nf3g1 Nf6g8 Ng1f3 Ng8f6 Nf3g1 Nf6g8")
+			self.assertTrue(game.is_threefold_repetition())
+			self.assertEqual(game.is_over(), claim_draws)
+
+	def test_repetition_window(self):
+		game = Game()
+		self.play(game, "Ng1f3 Ng8f6 Nf3g1 Nf6g8")
+		positions = dict(game.positions)
+		self.assertEqual(game.positions[game.key], 2)
+		# nothing before a pawn move can come round again
+		self.play(game, "Pe2e4")
+		self.assertEqual(game.positions, {game.key: 1})
+		game.pop()
+		self.assertEqual(game.positions, positions)
+
+class ArchiveTest(unittest.TestCase):
+
+	games = [
+		"Pf2f3 Pe7e5 Pg2g4 Qd8h4".split(),
+		"Pe2e4 Pe7e5 Ng1f3 Nb8c6 Bf1c4 Ng8f6 0-0 Bf8c5 Pc2c3".split(),
+		[],
+		"Pe2e4 Pd7d5 Pe4d5 Qd8d5 Nb1c3 Qd5a5 Pd2d4 Pc7c6 Ng1f3 Bc8g4".split()
+	]
+
+	def test_round_trip(self):
+		with tempfile.TemporaryDirectory() as tmp_dir:
+			path = os.path.join(tmp_dir, 'games.tca')
+			results = []
+			with ArchiveWriter(path) as writer:
+				for move_strs in self.games:
+					game = Game()
+					writer.record(game)
+					for move_str in move_strs:
+						self.assertFalse(game.make_move(move_str))
+						game.finish_move()
+					game.is_over()
+					results.append(game.result or '*')
+					writer.finish(game)
+			self.assertEqual(results[0], '0-1')
+			with ArchiveReader(path) as reader:
+				self.assertEqual(len(reader), len(self.games))
+				for archived, move_strs, result in zip(reader, self.games, results):
+					self.assertEqual(archived.result, result)
+					played = [str(move) for move, game in replay(archived.moves)][1:]
+					self.assertEqual(played, move_strs)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,112 @@
+# A fixed-size transposition table for the search, keyed by Game.key.
+#
+# The table is one preallocated flat array of 64-bit words (a memoryview
+# over a bytearray, or over any buffer passed in, such as shared memory).
+# It is split into buckets of two entries: the first is depth-preferred
+# (only replaced by a search at least as deep, or once it is left over
+# from an earlier search), the second is always replaced. Each entry is
+# two words, the packed data and the key xored with it, so a half-written
+# entry simply fails to match instead of returning another position's data.
+
+ENTRY_BYTES = 16
+BUCKET_ENTRIES = 2
+BUCKET_WORDS = BUCKET_ENTRIES * ENTRY_BYTES // 8
+
+# entry flags: how the stored score relates to the true score
+EXACT = 0
+LOWER = 1 # failed high: the score is a lower bound
+UPPER = 2 # failed low: the score is an upper bound
+
+SCORE_OFFSET = 1 << 31
+
+# data word layout: move code (16 bits) | score + offset (32) | depth (8) | flag (2) | generation (6)
+def pack(move_code, score, depth, flag, generation):
+	return (move_code | (score + SCORE_OFFSET) << 16 | depth << 48 | flag << 56 | generation << 58)
+
+def unpack(data):
+	return data & 0xffff, (data >> 16 & 0xffffffff) - SCORE_OFFSET, data >> 48 & 0xff, data >> 56 & 3
+
+class TranspositionTable:
+
+	def __init__(self, size_mb=16, buffer=None):
+		if buffer is None:
+			buffer = bytearray(self.buffer_size(size_mb))
+		self.buffer = buffer
+		self.table = memoryview(buffer).cast('Q')
+		# buckets is a power of two so the index is just the low bits of the key
+		self.mask = len(self.table) // BUCKET_WORDS - 1
+		self.generation = 0
+		self.hits = 0
+		self.misses = 0
+		self.collisions = 0
+
+	# bytes used by a table of at most size_mb (rounded down to a power of
+	# two number of buckets), for callers that allocate the buffer themselves
+	@staticmethod
+	def buffer_size(size_mb):
+		buckets = 1
+		while buckets * 2 * BUCKET_WORDS * 8 <= size_mb * (1 << 20):
+			buckets *= 2
+		return buckets * BUCKET_WORDS * 8
+
+	@property
+	def size_bytes(self):
+		return len(self.table) * 8
+
+	# call at the start of every search so entries from earlier ones age out
+	def new_search(self):
+		self.generation = (self.generation + 1) & 63
+
+	# let go of the buffer, which a shared memory block needs before it can close
+	def close(self):
+		self.table.release()
+		if isinstance(self.buffer, memoryview):
+			self.buffer.release()
+
+	def clear(self):
+		memoryview(self.buffer)[:] = bytes(self.size_bytes)
+		self.hits = self.misses = self.collisions = 0
+
+	# (move code, score, depth, flag) for key, or None
+	def probe(self, key):
+		table = self.table
+		bucket = (key & self.mask) * BUCKET_WORDS
+		for i in (bucket, bucket + 2):
+			data = table[i + 1]
+			if table[i] ^ data == key and data:
+				self.hits += 1
+				return unpack(data)
+		self.misses += 1
+		return None
+
+	def store(self, key, move_code, score, depth, flag):
+		table = self.table
+		data = pack(move_code, score, depth, flag, self.generation)
+		i = (key & self.mask) * BUCKET_WORDS
+		old_data = table[i + 1]
+		old_key = table[i] ^ old_data
+		if (old_key == key or not old_data or depth >= (old_data >> 48 & 0xff)
+				or old_data >> 58 != self.generation):
+			if old_data and old_key != key:
+				self.collisions += 1
+		else:
+			i += 2
+			old_data = table[i + 1]
+			if old_data and table[i] ^ old_data != key:
+				self.collisions += 1
+		table[i] = key ^ data
+		table[i + 1] = data
+
+	# fraction of entries in use, estimated from the first thousand buckets
+	def fill(self):
+		sample = min(1000, self.mask + 1) * BUCKET_WORDS
+		return sum(1 for i in range(1, sample, 2) if self.table[i]) / (sample // 2)
+
+	def stats(self):
+		return {
+			'size_bytes': self.size_bytes,
+			'hits': self.hits,
+			'misses': self.misses,
+			'collisions': self.collisions,
+			'fill': round(self.fill(), 3)
+		}
@@ -0,0 +1,186 @@
+# UCI front end (python game.py --uci), so the engine can be driven by
+# chess GUIs and tournament managers. Commands are read from stdin one
+# line at a time; searches run on a background thread so stop and isready
+# are answered while the engine thinks.
+
+import os
+import sys
+import threading
+
+from game import Game, WHITE
+from engine import Search, analyze, MATE, MAX_PLY
+from transposition import TranspositionTable
+
+MAX_HASH_MB = 4096
+
+# seconds to think when the clock is given: an even share of the time
+# left over the moves still to play, plus most of the increment, but
+# never so much that the flag could fall
+def time_for_move(remaining_ms, increment_ms=0, moves_to_go=None):
+	share = remaining_ms / (moves_to_go or 30) + increment_ms * 0.8
+	return max(min(share, remaining_ms * 0.5 - 50), 10) / 1000
+
+def format_score(score):
+	if score >= MATE - MAX_PLY:
+		return "mate {}".format((MATE - score + 1) // 2)
+	if score <= -MATE + MAX_PLY:
+		return "mate -{}".format((MATE + score) // 2)
+	return "cp {}".format(score)
+
+class UCI:
+
+	def __init__(self, out=sys.stdout):
+		self.out = out
+		self.lock = threading.Lock()
+		self.game = Game()
+		self.hash_mb = 16
+		self.threads = 1
+		self.table = TranspositionTable(self.hash_mb)
+		# the running search: a Search with one thread, or the stop event
+		# handed to analyze with more; stop is set once the GUI says stop
+		self.search = None
+		self.workers_stop = None
+		self.stop = None
+		self.thread = None
+
+	def send(self, line):
+		with self.lock:
+			self.out.write(line + '\n')
+			self.out.flush()
+
+	# handle commands until quit or the end of input
+	def run(self, lines=sys.stdin):
+		for line in lines:
+			if not self.handle(line.split()):
+				break
+		self.stop_search()
+
+	# returns False once the engine should quit
+	def handle(self, tokens):
+		if not tokens:
+			return True
+		command, args = tokens[0], tokens[1:]
+		if command == 'uci':
+			self.send("id name Text-Chess")
+			self.send("id author Text-Chess contributors")
+			self.send("option name Hash type spin default 16 min 1 max {}".format(MAX_HASH_MB))
+			self.send("option name Threads type spin default 1 min 1 max {}".format(os.cpu_count()))
+			self.send("uciok")
+		elif command == 'isready':
+			self.send("readyok")
+		elif command == 'setoption':
+			self.stop_search()
+			self.set_option(args)
+		elif command == 'ucinewgame':
+			self.stop_search()
+			self.game = Game()
+			self.table.clear()
+		elif command == 'position':
+			self.stop_search()
+			self.set_position(args)
+		elif command == 'go':
+			self.stop_search()
+			self.go(args)
+		elif command == 'stop':
+			self.stop_search()
+		elif command == 'quit':
+			return False
+		return True
+
+	# setoption name <name> value <value>
+	def set_option(self, args):
+		if 'name' not in args or 'value' not in args:
+			return
+		name = ' '.join(args[args.index('name')+1:args.index('value')]).lower()
+		value = ' '.join(args[args.index('value')+1:])
+		try:
+			value = int(value)
+		except ValueError:
+			self.send("info string option value must be a number: {}".format(value))
+			return
+		if name == 'hash':
+			self.hash_mb = max(1, min(value, MAX_HASH_MB))
+			self.table = TranspositionTable(self.hash_mb)
+		elif name == 'threads':
+			self.threads = max(1, value)
+		else:
+			self.send("info string unknown option {}".format(name))
+
+	# position (startpos | fen <fen>) [moves <move> ...]
+	def set_position(self, args):
+		moves = []
+		if 'moves' in args:
+			moves = args[args.index('moves')+1:]
+			args = args[:args.index('moves')]
+		try:
+			if args[:1] == ['startpos']:
+				game = Game()
+			elif args[:1] == ['fen']:
+				game = Game.from_fen(' '.join(args[1:]))
+			else:
+				self.send("info string position needs startpos or fen")
+				return
+		except ValueError as e:
+			self.send("info string {}".format(e))
+			return
+		for move_str in moves:
+			move = next((move for move in game.legal_moves() if move.uci == move_str), None)
+			if move is None:
+				self.send("info string illegal move {}".format(move_str))
+				break
+			game.push(move)
+		self.game = game
+
+	# go [depth N] [movetime MS] [wtime MS] [btime MS] [winc MS] [binc MS] [movestogo N] [infinite]
+	def go(self, args):
+		params = {}
+		for name, value in zip(args, args[1:]):
+			if value.lstrip('-').isdigit():
+				params[name] = int(value)
+		infinite = 'infinite' in args or 'ponder' in args
+		depth = params.get('depth')
+		time_limit = None
+		if 'movetime' in params:
+			time_limit = params['movetime'] / 1000
+		elif not infinite:
+			side = 'w' if self.game.color == WHITE else 'b'
+			if side + 'time' in params:
+				time_limit = time_for_move(params[side + 'time'], params.get(side + 'inc', 0), params.get('movestogo'))
+		if infinite:
+			depth = time_limit = None
+		self.stop = threading.Event()
+		if self.threads == 1:
+			self.search = Search(self.game, depth, time_limit, self.info, self.table)
+		else:
+			self.workers_stop = threading.Event()
+		self.thread = threading.Thread(target=self.think, args=(self.game, depth, time_limit, infinite), daemon=True)
+		self.thread.start()
+
+	def info(self, depth, score, nodes, seconds, pv):
+		self.send("info depth {} score {} nodes {} nps {} time {} pv {}".format(depth, format_score(score),
+			nodes, int(nodes / seconds) if seconds else 0, int(seconds * 1000), ' '.join(move.uci for move in pv)))
+
+	def think(self, game, depth, time_limit, infinite):
+		if self.search is not None:
+			move = self.search.run()[0]
+		else:
+			move = analyze(game, self.threads, depth, time_limit, self.hash_mb, self.info, self.workers_stop)[0]
+		# an infinite search only reports its move once told to stop
+		if infinite:
+			self.stop.wait()
+		self.send("bestmove {}".format(move.uci if move else '0000'))
+
+	def stop_search(self):
+		if self.thread is None:
+			return
+		self.stop.set()
+		if self.search is not None:
+			self.search.stopped = True
+		else:
+			self.workers_stop.set()
+		self.thread.join()
+		self.thread = self.search = self.workers_stop = None
+
+def run_uci():
+	UCI().run()
+	return 0